@@ -0,0 +1,88 @@
+# Packets/second of the `/visage float[63]` fast-path decoder versus the
+# generic pythonosc dispatcher, and frames/second of bundles and compact
+# messages, no blender needed:
+#
+#   python Blender/benchmarks/decode.py
+
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from visage import core
+from pythonosc import dispatcher
+from pythonosc.osc_message_builder import OscMessageBuilder
+
+
+PACKETS = 200000
+BUNDLE = 4 # frames per bundle or compact message
+
+
+def build_packet():
+    builder = OscMessageBuilder(address='/visage')
+    for i in range(63):
+        builder.add_arg(i / 63., builder.ARG_TYPE_FLOAT)
+    return builder.build().dgram
+
+
+def make_channel():
+    channel = core.VisageChannel('bench', 0, core.VisageInput(fork=True))
+    channel.attach()
+    return channel
+
+
+def bench_fast(channel, packet):
+    decode = core.decode_visage_packet
+    receive = channel.receive_frame
+    start = time.perf_counter()
+    for i in range(PACKETS):
+        receive(decode(packet))
+    return PACKETS / (time.perf_counter() - start)
+
+
+def bench_dispatcher(channel, packet):
+    dispatch = dispatcher.Dispatcher()
+    dispatch.map('/visage', channel.receive)
+    handle = dispatch.call_handlers_for_packet
+    address = ('127.0.0.1', 0)
+    start = time.perf_counter()
+    for i in range(PACKETS):
+        handle(packet, address)
+    return PACKETS / (time.perf_counter() - start)
+
+
+def bench_frames(channel, packet):
+    decode = core.decode_visage_frames
+    receive = channel.receive_frames
+    count = PACKETS // BUNDLE
+    start = time.perf_counter()
+    for i in range(count):
+        receive(decode(packet))
+    return count * BUNDLE / (time.perf_counter() - start)
+
+
+def main():
+    packet = build_packet()
+    assert len(packet) == core.VISAGE_PACKET_SIZE
+    channel = make_channel()
+
+    fast = bench_fast(channel, packet)
+    slow = bench_dispatcher(channel, packet)
+
+    print('fast path:  %10.0f packets/s' % fast)
+    print('dispatcher: %10.0f packets/s' % slow)
+    print('speedup:    %10.1fx' % (fast / slow))
+
+    frames = np.tile(np.arange(63) / 63., (BUNDLE, 1))
+    bundle = bench_frames(channel, core.encode_visage_bundle(frames))
+    compact = bench_frames(channel, core.encode_visage_compact(frames))
+
+    print('bundle:     %10.0f frames/s' % bundle)
+    print('compact:    %10.0f frames/s' % compact)
+
+
+if __name__ == '__main__':
+    main()
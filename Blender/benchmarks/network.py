@@ -0,0 +1,163 @@
+# Receiver behaviour under synthetic network load: frames received and
+# dropped, send to consumer latency and receiver CPU, for both fork and
+# thread receivers. No blender or phone needed, linux only (CPU is read
+# from /proc):
+#
+#   python Blender/benchmarks/network.py
+#   python Blender/benchmarks/network.py --duration 10 --modes fork --scenarios steady-60 lossy
+
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from visage import core
+from visage.sender import make_schedule, send_frames, synthetic_frames
+
+
+SCENARIOS = {
+    'steady-30': dict(rate=30),
+    'steady-60': dict(rate=60),
+    'steady-120': dict(rate=120),
+    'burst-120': dict(rate=120, burst=4),
+    'flood-1000': dict(rate=1000),
+    'jitter': dict(rate=60, jitter=0.004),
+    'lossy': dict(rate=60, loss=0.05, loss_run=3),
+    'reorder': dict(rate=60, reorder=0.05),
+    'bundle-4': dict(rate=240, bundle=4),
+    'compact-4': dict(rate=240, bundle=4, compact=True),
+}
+
+MODES = ['fork', 'thread']
+SETTLE = 0.2 # seconds for the receiver to bind and for stragglers to arrive
+CLOCK_TICKS = os.sysconf('SC_CLK_TCK')
+
+
+def free_port():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+def cpu_seconds(receiver):
+    # user + system time of the receiver process or thread
+    if receiver.fork:
+        path = '/proc/%d/stat' % receiver.process.pid
+    else:
+        path = '/proc/self/task/%d/stat' % receiver.process.native_id
+    with open(path) as f:
+        fields = f.read().rsplit(')', 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+
+
+def run(mode, scenario, duration, seed=0):
+    params = dict(SCENARIOS[scenario])
+    bundle = params.pop('bundle', 1)
+    compact = params.pop('compact', False)
+    rate = params['rate']
+    count = int(rate * duration)
+
+    port = free_port()
+    fork = mode == 'fork'
+    input = core.VisageInput(fork)
+    channel = core.VisageChannel(scenario, port, input)
+    receiver = core.VisageReceiver('127.0.0.1', [channel], fork)
+    receiver.start()
+    time.sleep(SETTLE)
+    receiver.start_recording(0.)
+
+    # channel 52 carries the frame sequence number (a float transform, so it
+    # survives compact encoding), the last channel the send time, so drops,
+    # reordering and latency can be read back out
+    frames = synthetic_frames(count, rate, seed)
+    frames[:, 52] = np.arange(count)
+    order, times = make_schedule(duration=duration, seed=seed, **params)
+
+    epoch = time.monotonic()
+    sender = core.mp.Process(target=send_frames, args=('127.0.0.1', port, frames, order, times, epoch, bundle, compact))
+    cpu_start = cpu_seconds(receiver)
+    sender.start()
+
+    latency = []
+    received = []
+    deadline = None
+    while deadline is None or time.monotonic() < deadline:
+        if receiver.wait_for_frame(0.05):
+            latency.append(time.monotonic() - epoch - input.frame[-1])
+        received.append(input.buffer.drain()[:, 52])
+        if deadline is None and not sender.is_alive():
+            deadline = time.monotonic() + SETTLE
+    wall = time.monotonic() - epoch - SETTLE
+    cpu = cpu_seconds(receiver) - cpu_start
+
+    sender.join()
+    receiver.stop()
+    receiver.process.join()
+
+    received = np.concatenate(received).astype(int)
+    latency = np.array(latency) * 1000.
+    sent = len(order)
+    unique = len(np.unique(received))
+    return {
+        'mode': mode,
+        'scenario': scenario,
+        'sent': sent,
+        'lost_on_network': count - sent,
+        'received': len(received),
+        'dropped': sent - unique,
+        'reordered': int(np.count_nonzero(np.diff(received) < 0)),
+        'duplicates': len(received) - unique,
+        'ring_overflow': input.buffer.overflow,
+        'latency_ms': {
+            'p50': float(np.percentile(latency, 50)) if len(latency) else None,
+            'p95': float(np.percentile(latency, 95)) if len(latency) else None,
+            'p99': float(np.percentile(latency, 99)) if len(latency) else None,
+            'max': float(latency.max()) if len(latency) else None,
+        },
+        'cpu_percent': 100. * cpu / wall,
+    }
+
+
+def format_ms(value):
+    return '%7.2f' % value if value is not None else '      -'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Visage receiver network load benchmark.')
+    parser.add_argument('--duration', type=float, default=5., help='seconds per scenario')
+    parser.add_argument('--modes', nargs='+', choices=MODES, default=MODES)
+    parser.add_argument('--scenarios', nargs='+', choices=list(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', help='also write results to this file')
+    args = parser.parse_args()
+
+    print('%-7s %-11s %6s %6s %7s %5s %7s %7s %7s %7s %6s' % (
+        'mode', 'scenario', 'sent', 'recv', 'dropped', 'reord',
+        'p50 ms', 'p95 ms', 'p99 ms', 'max ms', 'cpu %'))
+
+    results = []
+    for scenario in args.scenarios:
+        for mode in args.modes:
+            result = run(mode, scenario, args.duration, args.seed)
+            results.append(result)
+            latency = result['latency_ms']
+            print('%-7s %-11s %6d %6d %7d %5d %s %s %s %s %6.1f' % (
+                mode, scenario, result['sent'], result['received'], result['dropped'],
+                result['reordered'], format_ms(latency['p50']), format_ms(latency['p95']),
+                format_ms(latency['p99']), format_ms(latency['max']), result['cpu_percent']))
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
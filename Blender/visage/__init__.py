@@ -0,0 +1,22 @@
+bl_info = {
+    'name': 'Visage',
+    'author': 'Cardboard Computer',
+    'version': (0, 1),
+    'blender': (2, 93, 0),
+    'description': 'Receives OSC messages from Visage',
+    'category': 'Animation',
+}
+
+
+# the blender layer is only imported on register, so the package and its
+# bpy-free `core` can also be imported outside of blender
+
+
+def register():
+    from . import addon
+    addon.register()
+
+
+def unregister():
+    from . import addon
+    addon.unregister()
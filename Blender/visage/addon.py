@@ -0,0 +1,2056 @@
+import bpy
+import os
+import sys
+import math
+import time
+import threading
+import numpy as np
+from bpy_extras.io_utils import ExportHelper, ImportHelper
+
+from .core import (
+    SHAPE_KEYS,
+    SHAPE_KEY_IDX_TO_NAME,
+    SHAPE_KEY_SETS,
+    SHAPE_KEY_GROUP,
+    SHAPE_KEYS_MIRROR_PERM,
+    STREAM_FILTER_GROUPS,
+    STREAM_FILTER_MODES,
+    TAKE_EXTENSION,
+    FILTER_FALLOFF,
+    VisageChannel,
+    VisageInput,
+    VisageReceiver,
+    VisageRecording,
+    VisageStats,
+    VisageTakeWriter,
+    decimate_keys,
+    decode_take_records,
+    filter_butterworth,
+    filter_savgol,
+    filter_window,
+    find_stutter_frames,
+    lerp,
+    mp,
+    read_take,
+    remap,
+    resample_frames,
+    resolve_frames,
+    select_take_records,
+    unwrap_rotations,
+)
+
+
+state = None # visage.addon.state is like bpy.context
+
+
+UPDATE_STEP = 1. / 60.
+UPDATE_STEP_MIN = 1. / 240.
+UPDATE_STEP_MAX = 1. / 10.
+ARRIVAL_WINDOW = 0.5 # seconds of frames counted per arrival rate estimate
+
+
+def redraw_areas():
+    for area in bpy.context.screen.areas:
+        area.tag_redraw()
+
+
+def get_timeline_frame():
+    return bpy.context.scene.frame_current + bpy.context.scene.frame_subframe
+
+
+def get_timeline_seconds():
+    return get_timeline_frame() / bpy.context.scene.render.fps
+
+
+def get_active_target(context):
+    # the actor being edited in the panels, the scene's own target unless
+    # one of the extra actors is selected
+    scene = context.scene
+    if 0 <= scene.visage_actor_index < len(scene.visage_actors):
+        return scene.visage_actors[scene.visage_actor_index]
+    return scene.visage_target
+
+
+def get_targets(context):
+    # every actor captured into the scene, the scene's own target first
+    scene = context.scene
+    return [scene.visage_target] + [a for a in scene.visage_actors if a.enabled]
+
+
+def update_mapping(self, value):
+    # rebuilt on next use, so dragging a setting stays cheap
+    state.get_actor(self).mapping = None
+    state.preview_dirty = True
+
+
+def update_stream_filter(self, value):
+    t = self
+    params = state.get_actor(t).input.filter.view
+
+    for i, (group, start, count) in enumerate(STREAM_FILTER_GROUPS):
+        params[1 + start:1 + start + count] = t.stream_min_cutoff[i]
+        params[63 + start:63 + start + count] = t.stream_beta[i]
+    params[0] = STREAM_FILTER_MODES.index(t.stream_filter)
+
+
+def update_preview(self, value):
+    state.preview_dirty = True
+
+
+def update_neutral(self, value):
+    state.get_actor(self).load_neutral(self)
+    state.preview_dirty = True
+
+
+def get_key_block_ranges(key_blocks):
+    lo = np.empty(len(key_blocks), dtype=np.float32)
+    hi = np.empty(len(key_blocks), dtype=np.float32)
+    key_blocks.foreach_get('slider_min', lo)
+    key_blocks.foreach_get('slider_max', hi)
+    return lo, hi
+
+
+def get_mapping(target):
+    actor = state.get_actor(target)
+    if actor.mapping is None or actor.mapping.key != VisageMapping.identify(target):
+        actor.mapping = VisageMapping(target)
+    return actor.mapping
+
+
+def solve_visage_data(target, data, mapping=None):
+    # maps raw frames (..., 63) to the values written to the target,
+    # works on a single frame or on a whole recording at once; transforms
+    # are [head location, head rotation, left eye, right eye] x 3
+    mapping = mapping or get_mapping(target)
+    neutral = state.get_actor(target).neutral
+    data = np.asarray(data, dtype=np.float64)
+
+    weights = data[..., :52]
+    head_pos = data[..., 52:55]
+    head_rot = data[..., 55:58]
+    if target.apply_neutral:
+        weights = weights - neutral[:52]
+        head_pos = head_pos - neutral[52:55]
+        head_rot = head_rot - neutral[55:58]
+    weights = remap(weights, mapping.bias, mapping.scale)[..., mapping.perm]
+
+    transforms = np.zeros(data.shape[:-1] + (12,))
+    transforms[..., 0:3] = head_pos
+
+    b, s = target.head_rot_min_max
+    transforms[..., 3:6] = remap(np.radians(head_rot), b, s)
+
+    b, s = target.eyes_rot_min_max
+    transforms[..., 6:8] = remap(np.radians(data[..., 58:60]), b, s)
+    transforms[..., 9:11] = remap(np.radians(data[..., 60:62]), b, s)
+
+    return weights, mapping.mask, transforms
+
+
+def apply_visage_data(target, prefs, data, force=False):
+    # with `prefs.apply_delta` only channels that moved more than
+    # `prefs.apply_epsilon` since they were last written are written again,
+    # and the face is only tagged for update when a shape key changed
+    actor = state.get_actor(target)
+    mapping = get_mapping(target)
+
+    weights, mask, transforms = solve_visage_data(target, data, mapping)
+    weights = np.clip(weights, mapping.lo, mapping.hi)
+    new = np.concatenate((weights, transforms))
+
+    if force or actor.applied_mapping is not mapping:
+        actor.applied = np.full(len(new), np.nan)
+        actor.applied_mapping = mapping
+    epsilon = prefs.apply_epsilon if prefs.apply_delta else -1
+    dirty = mapping.written & ~(np.abs(new - actor.applied) <= epsilon)
+    actor.applied[dirty] = new[dirty]
+
+    shapes = dirty[:52]
+    if shapes.any():
+        key_blocks = target.face.shape_keys.key_blocks
+        values = actor.key_block_values
+        if len(values) != len(key_blocks):
+            values = actor.key_block_values = np.zeros(len(key_blocks), dtype=np.float32)
+        key_blocks.foreach_get('value', values)
+        values[mapping.indices[shapes]] = weights[shapes]
+        key_blocks.foreach_set('value', values)
+        target.face.update_tag()
+
+    for bone, prop, data_path, group, offset in mapping.bones:
+        if dirty[52 + offset:55 + offset].any():
+            setattr(bone, prop, transforms[offset:offset + 3])
+
+
+def record_visage_data(target, prefs):
+    scene = bpy.context.scene
+    actor = state.get_actor(target)
+    actor.recording.append(scene.frame_current, actor.input.frame)
+
+
+def ensure_action(id_data):
+    if id_data.animation_data is None:
+        id_data.animation_data_create()
+    if id_data.animation_data.action is None:
+        id_data.animation_data.action = bpy.data.actions.new('%sAction' % id_data.name)
+    return id_data.animation_data.action
+
+
+def ensure_fcurve(action, data_path, index=0, group=''):
+    curve = action.fcurves.find(data_path, index=index)
+    if curve is None:
+        curve = action.fcurves.new(data_path, index=index, action_group=group)
+    return curve
+
+
+def get_enum_value(struct, prop, item):
+    return struct.bl_rna.properties[prop].enum_items[item].value
+
+
+FCURVE_KEY_ATTRS = ['co', 'handle_left', 'handle_right', 'interpolation', 'handle_left_type', 'handle_right_type']
+
+
+def read_fcurve_keys(curve):
+    # every keyframe point attribute `bake_fcurve` writes, as arrays by name
+    count = len(curve.keyframe_points)
+    keys = {}
+    for attr in FCURVE_KEY_ATTRS:
+        if attr in ('co', 'handle_left', 'handle_right'):
+            keys[attr] = np.empty((count, 2))
+        else:
+            keys[attr] = np.empty(count, dtype=np.int32)
+        curve.keyframe_points.foreach_get(attr, keys[attr].ravel())
+    return keys
+
+
+def bake_fcurve(curve, frames, values, update=True, keys=None):
+    # merges sorted (frames, values) into `curve`, replacing keys on the same
+    # frames, and rewrites all of its keyframe points in bulk; without
+    # `update` the handles stay flat until the caller updates the curve.
+    # `keys` are the curve's points as returned by the last call without
+    # `update`, they save reading them back while the point count still
+    # matches; returns the points as written
+    points = curve.keyframe_points
+    count = len(points)
+    keyframe = bpy.types.Keyframe
+    bezier = get_enum_value(keyframe, 'interpolation', 'BEZIER')
+    auto_clamped = get_enum_value(keyframe, 'handle_left_type', 'AUTO_CLAMPED')
+
+    co = np.empty((len(frames), 2))
+    co[:, 0] = frames
+    co[:, 1] = values
+    new = {
+        'co': co,
+        'handle_left': co.copy(),
+        'handle_right': co.copy(),
+        'interpolation': np.full(len(frames), bezier, dtype=np.int32),
+        'handle_left_type': np.full(len(frames), auto_clamped, dtype=np.int32),
+        'handle_right_type': np.full(len(frames), auto_clamped, dtype=np.int32),
+    }
+
+    if keys is None or len(keys['co']) != count:
+        keys = read_fcurve_keys(curve)
+    if not len(frames):
+        return keys
+    if not count or frames[0] > keys['co'][-1, 0]:
+        # appending, as when a take is keyed a chunk at a time: the points
+        # already there are only written back, never cleared
+        keys = {attr: np.concatenate([keys[attr], new[attr]]) for attr in FCURVE_KEY_ATTRS}
+        points.add(len(frames))
+    else:
+        keep = ~np.isin(keys['co'][:, 0], frames)
+        order = np.argsort(np.concatenate([keys['co'][keep, 0], frames]), kind='stable')
+        keys = {attr: np.concatenate([keys[attr][keep], new[attr]])[order] for attr in FCURVE_KEY_ATTRS}
+        points.clear()
+        points.add(len(order))
+
+    for attr in FCURVE_KEY_ATTRS:
+        points.foreach_set(attr, keys[attr].ravel())
+    if update:
+        curve.update()
+    return keys
+
+
+def iter_bake_visage_data(target, frames, data, update=True, keys=None):
+    # keys whole arrays of raw frames (n, 63) onto the target's actions, one
+    # curve per step so the caller can stop between curves; `keys` caches
+    # each curve's points by pointer across calls, see `bake_fcurve`
+    frames = np.asarray(frames, dtype=np.float64)
+    order = np.argsort(frames, kind='stable')
+    frames = frames[order]
+    data = np.asarray(data, dtype=np.float64)[order]
+    if keys is None:
+        keys = {}
+
+    mapping = get_mapping(target)
+    weights, mask, transforms = solve_visage_data(target, data, mapping)
+
+    if target.face and target.face.shape_keys:
+        action = ensure_action(target.face.shape_keys)
+        weights = np.clip(weights, mapping.lo, mapping.hi)
+        for i in np.flatnonzero(mask):
+            curve = mapping.fcurve(action, mapping.key_paths[i], 0, SHAPE_KEY_GROUP[SHAPE_KEYS[i]])
+            pointer = curve.as_pointer()
+            keys[pointer] = bake_fcurve(curve, frames, weights[:, i], update, keys.get(pointer))
+            yield curve
+
+    if mapping.bones:
+        action = ensure_action(target.armature)
+        for bone, prop, data_path, group, offset in mapping.bones:
+            for index in range(3):
+                curve = mapping.fcurve(action, data_path, index, group)
+                pointer = curve.as_pointer()
+                keys[pointer] = bake_fcurve(curve, frames, transforms[:, offset + index], update, keys.get(pointer))
+                yield curve
+
+
+def bake_visage_data(target, frames, data):
+    return list(iter_bake_visage_data(target, frames, data))
+
+
+def get_visage_actions(target):
+    # face and armature actions currently assigned to the target
+    actions = []
+    for id_data in (target.face and target.face.shape_keys, target.armature):
+        if id_data and id_data.animation_data and id_data.animation_data.action:
+            actions.append(id_data.animation_data.action)
+    return actions
+
+
+def read_fcurve_co(curve):
+    co = np.empty(len(curve.keyframe_points) * 2)
+    curve.keyframe_points.foreach_get('co', co)
+    return co.reshape(-1, 2)
+
+
+def write_fcurve_co(curve, co):
+    points = curve.keyframe_points
+    points.clear()
+    points.add(len(co))
+    points.foreach_set('co', co.ravel())
+    curve.update()
+
+
+def shift_fcurve(curve, offset, start=None, end=None):
+    # moves keys and their handles up by `offset`, only keys within
+    # [start, end] if given
+    points = curve.keyframe_points
+    co = read_fcurve_co(curve)
+    keys = np.ones(len(co), dtype=bool)
+    if start is not None:
+        keys = (co[:, 0] >= start) & (co[:, 0] <= end)
+    if not keys.any():
+        return
+    co[keys, 1] += offset
+    points.foreach_set('co', co.ravel())
+    for attr in ('handle_left', 'handle_right'):
+        handles = np.empty((len(co), 2))
+        points.foreach_get(attr, handles.ravel())
+        handles[keys, 1] += offset
+        points.foreach_set(attr, handles.ravel())
+    curve.update()
+
+
+def get_neutral_offsets(target, neutral):
+    # neutral pose in curve units, by (data path, index) of the target's
+    # f-curves, so the same shift `solve_visage_data` applies can be made
+    # to keys already baked
+    mapping = get_mapping(target)
+    offsets = {}
+    for i, data_path in enumerate(mapping.key_paths):
+        channel = mapping.perm[i]
+        offsets[(data_path, 0)] = neutral[channel] * mapping.scale[channel]
+
+    scales = {0: 1., 3: target.head_rot_min_max[1], 6: target.eyes_rot_min_max[1], 9: target.eyes_rot_min_max[1]}
+    channels = {0: 52, 3: 55, 6: 58, 9: 60} # transform offset to neutral channel
+    for bone, prop, data_path, group, offset in mapping.bones:
+        values = neutral[channels[offset]:channels[offset] + (3 if offset < 6 else 2)]
+        if offset:
+            values = np.radians(values)
+        for index, value in enumerate(values):
+            offsets[(data_path, index)] = value * scales[offset]
+    return offsets
+
+
+def decimate_fcurve(curve, max_error):
+    co = read_fcurve_co(curve)
+    if len(co) < 3:
+        return
+    x, y = co[:, 0], co[:, 1]
+    slope = np.gradient(y, x)
+    keys = decimate_keys(x, y, slope, max_error)
+    co = co[keys]
+    slope = slope[keys]
+
+    # handles a third of the way to the neighbouring keys, along the slope
+    dx = np.diff(co[:, 0])
+    left = np.concatenate((dx[:1], dx)) / 3
+    right = np.concatenate((dx, dx[-1:])) / 3
+    handle_left = np.stack((co[:, 0] - left, co[:, 1] - slope * left), axis=1)
+    handle_right = np.stack((co[:, 0] + right, co[:, 1] + slope * right), axis=1)
+
+    keyframe = bpy.types.Keyframe
+    bezier = get_enum_value(keyframe, 'interpolation', 'BEZIER')
+    aligned = get_enum_value(keyframe, 'handle_left_type', 'ALIGNED')
+
+    points = curve.keyframe_points
+    points.clear()
+    points.add(len(co))
+    points.foreach_set('co', co.ravel())
+    points.foreach_set('interpolation', np.full(len(co), bezier, dtype=np.int32))
+    points.foreach_set('handle_left_type', np.full(len(co), aligned, dtype=np.int32))
+    points.foreach_set('handle_right_type', np.full(len(co), aligned, dtype=np.int32))
+    points.foreach_set('handle_left', handle_left.ravel())
+    points.foreach_set('handle_right', handle_right.ravel())
+    curve.update()
+
+
+def queue_visage_recording(target, prefs, final=False):
+    # moves everything recorded for the target so far into its bake queue
+    actor = state.get_actor(target)
+    frames, data = actor.recording.pop(len(actor.recording))
+    source = bpy.context.scene.visage_target # keyframe settings are shared
+    if state.use_remote_timing:
+        actor.bake.queue(target, frames, data, prefs.frame_latency,
+            1. / source.resample_subframes, source.resample, final)
+    else:
+        actor.bake.queue(target, frames, data, prefs.frame_latency, final=final)
+
+
+def keyframe_visage_recording(target, prefs):
+    # keys the tail of the recording, earlier chunks may already have been
+    # keyed while recording, see `VisageState.bake_update`
+    actor = state.get_actor(target)
+    queue_visage_recording(target, prefs, final=True)
+    curves = actor.bake.finish()
+    if target.decimate_on_save:
+        for curve in curves:
+            decimate_fcurve(curve, target.decimate_error)
+
+    actor.recording.clear()
+
+
+def timer_update():
+    # wraper function needed for unregister
+    return state.update()
+
+
+def handler_frame_change_post(scene):
+    wm = bpy.context.window_manager
+    screen = bpy.context.screen
+
+    if wm.visage_preview:
+        # animation playback may have overwritten the preview
+        state.apply_targets(force=True)
+
+    if (not state.use_remote_timing
+        and wm.visage_record
+        and screen.is_animation_playing
+        and not screen.is_scrubbing):
+
+        if state.receiver.wait_for_frame(state.prefs.frame_timeout):
+            for target in get_targets(bpy.context):
+                record_visage_data(target, state.prefs)
+
+
+def maybe_toggle_timer():
+    # one timer serves both preview and record
+    wm = bpy.context.window_manager
+    if wm.visage_preview or wm.visage_record:
+        if not bpy.app.timers.is_registered(timer_update):
+            state.tick_time = None
+            bpy.app.timers.register(timer_update)
+    else:
+        if bpy.app.timers.is_registered(timer_update):
+            bpy.app.timers.unregister(timer_update)
+
+
+def maybe_toggle_frame_change_handler():
+    wm = bpy.context.window_manager
+    if wm.visage_preview or wm.visage_record:
+        if handler_frame_change_post not in bpy.app.handlers.frame_change_post:
+            bpy.app.handlers.frame_change_post.append(handler_frame_change_post)
+    else:
+        if handler_frame_change_post in bpy.app.handlers.frame_change_post:
+            bpy.app.handlers.frame_change_post.remove(handler_frame_change_post)
+
+
+class VisageMapping:
+    # a target's settings and scene data resolved into flat arrays, so the
+    # hot paths do no name lookups or string formatting; built on first use,
+    # dropped by the target's update callbacks and by depsgraph updates to
+    # its face's shape keys or its armature
+
+    '''
+    `key`:
+        the face and armature it was built for, see `identify`
+
+    `ids`:
+        pointers of the shape keys, armature object and armature data it
+        was built from
+
+    `bias`, `scale`, `perm`:
+        weight remapping and mirror permutation of the 52 channels
+
+    `mask`:
+        channels written to the face, enabled and with a key block
+
+    `indices`, `lo`, `hi`:
+        key block index, -1 if missing, and slider range per channel
+
+    `key_paths`:
+        f-curve data path per channel
+
+    `bones`:
+        (pose bone, property, data path, group, offset) per enabled bone
+        transform, `offset` into the transforms from `solve_visage_data`
+
+    `written`:
+        which of the 52 weights and 12 transforms are written at all
+
+    `curves`:
+        f-curves resolved by `fcurve`, per action
+    '''
+
+    TRANSFORMS = [
+        ('head_pos_enabled', 'head', 'location', 0),
+        ('head_rot_enabled', 'head', 'rotation_euler', 3),
+        ('eyes_rot_enabled', 'eye_left', 'rotation_euler', 6),
+        ('eyes_rot_enabled', 'eye_right', 'rotation_euler', 9),
+    ]
+
+    def __init__(self, target):
+        t = target
+        self.key = self.identify(t)
+        self.ids = set()
+        if t.face and t.face.shape_keys:
+            self.ids.add(t.face.shape_keys.as_pointer())
+        if t.armature:
+            self.ids.add(t.armature.as_pointer())
+            if t.armature.data:
+                self.ids.add(t.armature.data.as_pointer())
+
+        self.bias = np.array(t.shape_min1[:] + t.shape_min2[:])
+        self.scale = np.array(t.shape_max1[:] + t.shape_max2[:])
+        self.perm = SHAPE_KEYS_MIRROR_PERM[t.mirror]
+        enabled = np.zeros(52, dtype=bool)
+        for label, start, count in SHAPE_KEY_SETS:
+            if getattr(t, '%s_enabled' % label):
+                enabled[start:start + count] = getattr(t, 'sub_%s_enabled' % label)
+
+        self.indices = np.full(52, -1)
+        self.lo = np.zeros(52)
+        self.hi = np.ones(52)
+        if t.face and t.face.shape_keys:
+            key_blocks = t.face.shape_keys.key_blocks
+            self.indices = np.array([key_blocks.find(n) for n in SHAPE_KEYS])
+            found = self.indices >= 0
+            lo, hi = get_key_block_ranges(key_blocks)
+            self.lo[found] = lo[self.indices[found]]
+            self.hi[found] = hi[self.indices[found]]
+        self.mask = enabled[self.perm] & (self.indices >= 0)
+        self.key_paths = ['key_blocks["%s"].value' % n for n in SHAPE_KEYS]
+
+        self.bones = []
+        self.written = np.zeros(64, dtype=bool)
+        self.written[:52] = self.mask
+        if t.armature and t.armature.pose:
+            pose_bones = t.armature.pose.bones
+            for flag, attr, prop, offset in self.TRANSFORMS:
+                name = getattr(t, attr)
+                bone = pose_bones.get(name)
+                if getattr(t, flag) and bone is not None:
+                    data_path = 'pose.bones["%s"].%s' % (name, prop)
+                    self.bones.append((bone, prop, data_path, name, offset))
+                    self.written[52 + offset:55 + offset] = True
+
+        self.curves = {}
+
+    @staticmethod
+    def identify(target):
+        shape_keys = target.face and target.face.shape_keys
+        armature = target.armature
+        return (
+            shape_keys.as_pointer() if shape_keys else None,
+            len(shape_keys.key_blocks) if shape_keys else None,
+            armature.as_pointer() if armature else None)
+
+    def fcurve(self, action, data_path, index=0, group=''):
+        # cached per action while its curve count is unchanged, so deleted
+        # curves are never handed out, and while the cached curve still has
+        # its path, which a rename or undo may change
+        pointer = action.as_pointer()
+        count, curves = self.curves.get(pointer, (None, None))
+        if count != len(action.fcurves):
+            curves = {}
+        curve = curves.get((data_path, index))
+        if curve is None or curve.data_path != data_path or curve.array_index != index:
+            curve = curves[(data_path, index)] = ensure_fcurve(action, data_path, index, group)
+        self.curves[pointer] = (len(action.fcurves), curves)
+        return curve
+
+
+class VisageBake:
+    # keys an actor's recording onto its curves a chunk at a time while it
+    # records, so saving only has the tail left
+
+    '''
+    `steps`:
+        (rows, generator from `iter_bake_visage_data`) per queued chunk,
+        each step keys one curve so work can stop on the tick's time budget
+
+    `curves`:
+        curves keyed since the last finish, by pointer; their handles are
+        only recalculated on finish
+
+    `keys`:
+        points last written to each of `curves`, by pointer, so appending a
+        chunk reads nothing back, see `bake_fcurve`
+
+    `cost`:
+        seconds the slowest step took, a step is only started if it would
+        still finish before the deadline
+
+    `carry`:
+        last rows of the previous resampled chunk, the next one is
+        interpolated on from them so chunk edges key as in one whole take
+
+    `keyed`:
+        last resampled frame keyed
+    '''
+
+    CARRY = 3 # rows, the cubic slope at a row needs both of its neighbours
+
+    def __init__(self):
+        self.clear()
+
+    def __len__(self):
+        return len(self.steps)
+
+    @property
+    def pending(self):
+        # recorded rows not keyed yet, queued or carried to the next chunk
+        carried = np.count_nonzero(self.carry[0] > self.keyed) if self.carry is not None else 0
+        return sum(rows for rows, step in self.steps) + carried
+
+    def clear(self):
+        self.steps = []
+        self.curves = {}
+        self.keys = {}
+        self.cost = 0
+        self.carry = None
+        self.keyed = -math.inf
+
+    def queue(self, target, frames, data, latency=0, step=None, mode='NONE', final=False):
+        # rows are keyed as recorded, or resampled every `step` frames; the
+        # last rows of a chunk wait for the next one unless it is `final`,
+        # which also ends the pass so the next one starts afresh
+        if self.carry is not None and len(frames) and frames.max() < self.carry[0][0]:
+            # the frames went back, a new pass: finish the one before it
+            self.queue(target, frames[:0], data[:0], latency, step, mode, final=True)
+        if self.carry is not None:
+            frames = np.concatenate([self.carry[0], frames])
+            data = np.concatenate([self.carry[1], data])
+            self.carry = None
+        if not len(frames):
+            if final:
+                self.keyed = -math.inf
+            return
+        frames, data = resolve_frames(frames, data)
+
+        if step is not None:
+            if not final and len(frames) < self.CARRY:
+                self.carry = (frames, data)
+                return
+            if mode != 'NONE':
+                data = unwrap_rotations(data) # carried rows stay continuous
+            end = frames[-1]
+            if not final:
+                self.carry = (frames[-self.CARRY:], data[-self.CARRY:])
+                end = frames[-2]
+            frames, data = resample_frames(frames, data, step, mode)
+            keep = (frames > self.keyed) & (frames <= end)
+            frames, data = frames[keep], data[keep]
+            if len(frames):
+                self.keyed = frames[-1]
+
+        if len(frames):
+            self.steps.append((len(frames), iter_bake_visage_data(target, frames - latency, data, False, self.keys)))
+        if final:
+            self.keyed = -math.inf
+
+    def run(self, deadline=math.inf):
+        # keys queued curves until done or the next step would end past
+        # `deadline` (perf_counter); at least one step runs per call so a
+        # budget shorter than a step still makes progress
+        now = time.perf_counter()
+        first = True
+        while self.steps and (first or now + self.cost < deadline):
+            curve = next(self.steps[0][1], None)
+            if curve is None:
+                self.steps.pop(0)
+            else:
+                self.curves[curve.as_pointer()] = curve
+            end = time.perf_counter()
+            self.cost = max(self.cost, end - now)
+            now = end
+            first = False
+        return not self.steps
+
+    def finish(self):
+        self.run()
+        curves = list(self.curves.values())
+        for curve in curves:
+            curve.update()
+        self.clear()
+        return curves
+
+
+class VisageActor:
+    # runtime state of one captured actor, kept across receiver restarts
+
+    '''
+    `input`:
+        buffers shared with the receiver, see `core.VisageInput`
+
+    `recording`:
+        frames captured for this actor and not yet queued to `bake`
+    '''
+
+    def __init__(self, fork, event):
+        self.neutral = np.zeros(62)
+        self.recording = VisageRecording(63)
+        self.bake = VisageBake()
+        self.mapping = None # see `get_mapping`
+        self.key_block_values = np.zeros(0, dtype=np.float32)
+        self.input = VisageInput(fork, event)
+        self.previewed = 0 # frames received as of the last preview update
+        self.arrived = 0 # frames received as of the last schedule
+        self.applied = None # last values written to the target, see apply_visage_data
+        self.applied_mapping = None
+
+    def load_neutral(self, target):
+        self.neutral = np.array(target.neutral1[:] + target.neutral2[:])
+
+
+class VisageState:
+    # local singleton only
+
+    '''
+    `actors`:
+        runtime state per target, keyed by the target's path in the scene
+
+    `event`:
+        shared by every actor's input, set on a frame from any of them
+
+    `stats`:
+        instrumentation shared with the receiver, see `core.VisageStats`
+    '''
+
+    def __init__(self):
+        self.receiver = None
+        self.use_remote_timing = False
+
+        self.fork = True if sys.platform == 'linux' else False
+        self.event = mp.Event() if self.fork else threading.Event()
+        self.actors = {}
+        self.stats = VisageStats()
+
+        self.preview_dirty = False # re-apply on the next tick without a new frame
+        self.tick_time = None
+        self.tick_interval = UPDATE_STEP
+        self.arrival_interval = UPDATE_STEP
+        self.arrival_frames = 0
+        self.arrival_time = 0
+        self.main_interval = 0
+
+    @property
+    def target(self):
+        return get_active_target(bpy.context)
+
+    @property
+    def prefs(self):
+        return bpy.context.preferences.addons['visage'].preferences
+
+    @property
+    def is_receiver_running(self):
+        return self.receiver and self.receiver.is_running
+
+    @property
+    def recording_length(self):
+        # frames to save, including those still waiting to be keyed
+        return sum(len(a.recording) + a.bake.pending for a in self.actors.values())
+
+    def get_actor(self, target):
+        path = target.path_from_id()
+        actor = self.actors.get(path)
+        if actor is None:
+            actor = self.actors[path] = VisageActor(self.fork, self.event)
+            actor.load_neutral(target)
+        return actor
+
+    def remove_actor(self, index):
+        # runtime state follows the actors that move down to fill the gap
+        actors = {}
+        for path, actor in self.actors.items():
+            if path.startswith('visage_actors['):
+                i = int(path[len('visage_actors['):-1])
+                if i == index:
+                    continue
+                if i > index:
+                    path = 'visage_actors[%d]' % (i - 1)
+            actors[path] = actor
+        self.actors = actors
+
+    def load_neutral(self):
+        for target in get_targets(bpy.context):
+            self.get_actor(target).load_neutral(target)
+
+    def start_receiver(self):
+        # returns the errors of takes that could not be opened, the capture
+        # runs without them
+        scene = bpy.context.scene
+        self.use_remote_timing = scene.visage_target.keyframe_source == 'BROADCAST'
+        if self.receiver is not None:
+            process = self.receiver.process
+            self.stop_receiver()
+            process.join(1) # let go of the ports before binding them again
+
+        targets = get_targets(bpy.context)
+        stamp = time.strftime('visage_%Y%m%d_%H%M%S')
+        fps = scene.render.fps / scene.render.fps_base
+        channels = []
+        errors = []
+        for i, target in enumerate(targets):
+            if i == 0:
+                name, port, source = 'default', self.prefs.port, ''
+            else:
+                name, port, source = target.name, target.port, target.source
+            take = None
+            if self.prefs.take_write:
+                filename = stamp + ('_%s' % bpy.path.clean_name(name) if i else '') + TAKE_EXTENSION
+                path = os.path.join(bpy.path.abspath(self.prefs.take_directory), filename)
+                take = VisageTakeWriter(path, fps, self.prefs.take_quantize)
+                try:
+                    take.open()
+                except OSError as e:
+                    errors.append('Cannot write take: %s' % e)
+                    take = None
+            update_stream_filter(target, None)
+            channels.append(VisageChannel(name, port, self.get_actor(target).input, source, take))
+
+        self.stats.enabled = self.prefs.stats_enabled
+        self.receiver = VisageReceiver(self.prefs.host, channels, self.fork, self.stats)
+        self.receiver.start()
+        return errors
+
+    def stop_receiver(self):
+        if self.receiver is not None:
+            self.receiver.stop()
+        self.receiver = None
+
+    def apply_targets(self, force=False, actors=None):
+        # every actor in one pass, so cost grows with the actor count only,
+        # `actors` limits the pass to those
+        start = time.perf_counter()
+        for target in get_targets(bpy.context):
+            if target.face and target.armature:
+                actor = self.get_actor(target)
+                if actors is None or actor in actors:
+                    apply_visage_data(target, self.prefs, actor.input.frame, force)
+        if self.stats.enabled:
+            self.stats.add('apply', (time.perf_counter() - start) * 1e6)
+
+    def update(self):
+        wm = bpy.context.window_manager
+        received = 0
+        if self.receiver:
+            received = self.arrival_update()
+            if wm.visage_record:
+                self.record_update()
+                self.bake_update()
+            if wm.visage_preview:
+                self.preview_update()
+        return self.schedule(received)
+
+    def arrival_update(self):
+        # returns the most frames any one actor received since the last
+        # update, so the schedule follows the fastest source rather than the
+        # sum of all of them, whether or not the preview is on
+        received = 0
+        for actor in self.actors.values():
+            frames = actor.input.status[2] - actor.arrived
+            actor.arrived += frames
+            received = max(received, frames)
+        return received
+
+    def schedule(self, received):
+        # next timer interval: twice per frame at the measured arrival rate,
+        # but no faster than blender gets around to running the timer
+        now = time.perf_counter()
+        elapsed = now - self.tick_time if self.tick_time else self.tick_interval
+        self.tick_time = now
+
+        self.arrival_frames += received
+        self.arrival_time += elapsed
+        if self.arrival_time >= ARRIVAL_WINDOW:
+            interval = self.arrival_time / max(self.arrival_frames, 1)
+            self.arrival_interval = lerp(self.arrival_interval, interval, 0.5)
+            self.arrival_frames = 0
+            self.arrival_time = 0
+
+        # time between runs when blender is slower than we asked for
+        late = elapsed > self.tick_interval * 1.25
+        self.main_interval = lerp(self.main_interval, elapsed if late else 0, 0.1)
+
+        interval = max(self.arrival_interval / 2, self.main_interval)
+        self.tick_interval = min(max(interval, UPDATE_STEP_MIN), UPDATE_STEP_MAX)
+        return self.tick_interval
+
+    def preview_update(self):
+        # applies the actors that received a frame since the last update
+        stats = self.stats if self.stats.enabled else None
+        fresh = []
+        for actor in self.actors.values():
+            frames = actor.input.status[2] - actor.previewed
+            actor.previewed += frames
+            if frames:
+                fresh.append(actor)
+            if stats and frames > 1:
+                stats.count('preview_skipped', frames - 1)
+        if stats:
+            stats.count('preview_ticks')
+            if not fresh:
+                stats.count('preview_idle')
+        if self.preview_dirty:
+            self.preview_dirty = False
+            self.apply_targets()
+        elif fresh:
+            self.apply_targets(actors=fresh)
+
+    def record_update(self):
+        if self.use_remote_timing:
+            screen = bpy.context.screen
+            fps = bpy.context.scene.render.fps
+            is_playing = screen.is_animation_playing and not screen.is_scrubbing
+
+            stopped = not is_playing and self.receiver.is_recording
+            if is_playing and not self.receiver.is_recording:
+                self.receiver.start_recording(get_timeline_seconds())
+            if stopped:
+                self.receiver.stop_recording()
+
+            for target in get_targets(bpy.context):
+                actor = self.get_actor(target)
+                if self.stats.enabled:
+                    self.stats.add('queue_depth', len(actor.input.buffer))
+                data = actor.input.buffer.drain()
+                actor.recording.extend((actor.input.timing[0] + data[:, -1]) * fps, data)
+                if stopped:
+                    # the pass is over, the next play starts a new one that
+                    # is resampled on its own
+                    queue_visage_recording(target, self.prefs, final=True)
+
+    def bake_update(self):
+        # queues each actor's recording every `bake_chunk` frames, even while
+        # earlier chunks are still queued so no chunk grows past that, and
+        # keys what is queued until the tick's budget is spent
+        prefs = self.prefs
+        if not prefs.bake_incremental:
+            return
+        start = time.perf_counter()
+        deadline = start + prefs.bake_budget / 1000
+        busy = False
+        for target in get_targets(bpy.context):
+            actor = self.get_actor(target)
+            if len(actor.recording) >= prefs.bake_chunk:
+                queue_visage_recording(target, prefs)
+            busy = busy or len(actor.bake) > 0
+            actor.bake.run(deadline)
+        if busy and self.stats.enabled:
+            self.stats.add('bake', (time.perf_counter() - start) * 1e6)
+
+
+class VisagePreferences(bpy.types.AddonPreferences):
+    bl_idname = 'visage'
+
+    host : bpy.props.StringProperty(default='localhost', name='Host')
+    port : bpy.props.IntProperty(default=8080, name='Port')
+    frame_latency : bpy.props.IntProperty(default=0, name='Frame Latency')
+    frame_timeout : bpy.props.FloatProperty(default=1, min=0, name='Frame Timeout') # seconds
+    apply_delta : bpy.props.BoolProperty(default=True, name='Only Apply Changes')
+    apply_epsilon : bpy.props.FloatProperty(default=0.0001, min=0, precision=5, name='Change Threshold')
+    take_write : bpy.props.BoolProperty(default=False, name='Write Take Files')
+    take_directory : bpy.props.StringProperty(default='//takes', subtype='DIR_PATH', name='Take Directory')
+    take_quantize : bpy.props.BoolProperty(default=False, name='Quantize Takes')
+    bake_incremental : bpy.props.BoolProperty(default=True, name='Key While Recording',
+        description='Key the recording a chunk at a time while recording, so saving only keys the tail')
+    bake_chunk : bpy.props.IntProperty(default=120, min=1, name='Chunk', description='Recorded frames per chunk')
+    bake_budget : bpy.props.FloatProperty(default=2, min=0.1, name='Budget', description='Milliseconds of keying per tick') # ms
+
+    def update_stats_enabled(self, context):
+        state.stats.enabled = self.stats_enabled
+
+    stats_enabled : bpy.props.BoolProperty(default=False, name='Collect Stats', update=update_stats_enabled)
+
+    def draw(self, context):
+        row = self.layout.row(align=True)
+        row.prop(self, 'host', text='Host')
+        row.prop(self, 'port', text='Port')
+        self.layout.prop(self, 'frame_latency', text='Frame Latency')
+        self.layout.prop(self, 'frame_timeout', text='Frame Timeout')
+        row = self.layout.row(align=True)
+        row.prop(self, 'apply_delta', text='')
+        sub = row.row(align=True)
+        sub.enabled = self.apply_delta
+        sub.prop(self, 'apply_epsilon', text='Change Threshold')
+        row = self.layout.row(align=True)
+        row.prop(self, 'take_write', text='')
+        sub = row.row(align=True)
+        sub.enabled = self.take_write
+        sub.prop(self, 'take_directory', text='Takes')
+        sub.prop(self, 'take_quantize', text='Quantize')
+        row = self.layout.row(align=True)
+        row.prop(self, 'bake_incremental', text='')
+        sub = row.row(align=True)
+        sub.enabled = self.bake_incremental
+        sub.prop(self, 'bake_chunk', text='Chunk')
+        sub.prop(self, 'bake_budget', text='Budget (ms)')
+        self.layout.prop(self, 'stats_enabled', text='Collect Stats')
+
+
+class VisageTarget(bpy.types.PropertyGroup):
+    face : bpy.props.PointerProperty(type=bpy.types.Mesh, name='Face', update=update_mapping)
+    armature : bpy.props.PointerProperty(type=bpy.types.Object, name='Armature', update=update_mapping)
+    head : bpy.props.StringProperty(default='Head', name='Head', update=update_mapping)
+    eye_left : bpy.props.StringProperty(default='Eye.L', name='Eye.L', update=update_mapping)
+    eye_right : bpy.props.StringProperty(default='Eye.R', name='Eye.R', update=update_mapping)
+
+    # capture channel of the extra actors in `Scene.visage_actors`, the
+    # scene's own target uses the add-on preferences
+    enabled : bpy.props.BoolProperty(default=True, name='Enabled')
+    port : bpy.props.IntProperty(default=8081, min=0, max=65535, name='Port')
+    source : bpy.props.StringProperty(default='', name='Source', description='Only take frames sent from this address')
+
+    head_rot_enabled : bpy.props.BoolProperty(default=False, update=update_mapping)
+    head_pos_enabled : bpy.props.BoolProperty(default=False, update=update_mapping)
+    eyes_rot_enabled : bpy.props.BoolProperty(default=True, update=update_mapping)
+    head_rot_min_max : bpy.props.FloatVectorProperty(size=2, default=[0, 1], update=update_preview)
+    eyes_rot_min_max : bpy.props.FloatVectorProperty(size=2, default=[0, 1], update=update_preview)
+
+    brow_enabled : bpy.props.BoolProperty(default=True, update=update_mapping)
+    eye_enabled : bpy.props.BoolProperty(default=True, update=update_mapping)
+    cheek_enabled : bpy.props.BoolProperty(default=True, update=update_mapping)
+    nose_enabled : bpy.props.BoolProperty(default=True, update=update_mapping)
+    jaw_enabled : bpy.props.BoolProperty(default=True, update=update_mapping)
+    mouth_enabled : bpy.props.BoolProperty(default=True, update=update_mapping)
+    tongue_enabled : bpy.props.BoolProperty(default=True, update=update_mapping)
+
+    sub_brow_enabled : bpy.props.BoolVectorProperty(size=5, default=[True]*5, update=update_mapping)
+    sub_eye_enabled : bpy.props.BoolVectorProperty(size=14, default=[True]*14, update=update_mapping)
+    sub_cheek_enabled : bpy.props.BoolVectorProperty(size=3, default=[True]*3, update=update_mapping)
+    sub_nose_enabled : bpy.props.BoolVectorProperty(size=2, default=[True]*2, update=update_mapping)
+    sub_jaw_enabled : bpy.props.BoolVectorProperty(size=4, default=[True]*4, update=update_mapping)
+    sub_mouth_enabled : bpy.props.BoolVectorProperty(size=23, default=[True]*23, update=update_mapping)
+    sub_tongue_enabled : bpy.props.BoolVectorProperty(size=1, default=[True]*1, update=update_mapping)
+
+    shape_min1 : bpy.props.FloatVectorProperty(size=32, default=[0.0]*32, update=update_mapping)
+    shape_max1 : bpy.props.FloatVectorProperty(size=32, default=[1.0]*32, update=update_mapping)
+    shape_min2 : bpy.props.FloatVectorProperty(size=20, default=[0.0]*20, update=update_mapping)
+    shape_max2 : bpy.props.FloatVectorProperty(size=20, default=[1.0]*20, update=update_mapping)
+
+    MIRROR_ITEMS = [
+        ('NONE', 'No Mirroring', 'No mirroring'),
+        ('LEFT', 'Mirror Left', 'Mirror left'),
+        ('RIGHT', 'Mirror Right', 'Mirror right'),
+    ]
+
+    mirror : bpy.props.EnumProperty(items=MIRROR_ITEMS, default='NONE', name='Mirroring', update=update_mapping)
+
+    FALLOFF_ITEMS = (
+        ('UNIFORM', 'Uniform', 'Uniform'),
+        ('LINEAR', 'Linear', 'Linear'),
+        ('SQUARE', 'Square', 'Square'),
+        ('SQUARE_INVERSE', 'Inverse Square', 'Inverse Square'),
+        ('SMOOTH', 'Smooth', 'Smooth'),
+        ('SMOOTH_X2', 'Smooth x2', 'Smooth x2'),
+    )
+
+    FILTER_ITEMS = (
+        ('WINDOW', 'Window', 'Moving average with a value falloff'),
+        ('BUTTERWORTH', 'Butterworth', 'Zero-phase Butterworth low-pass'),
+        ('SAVGOL', 'Savitzky-Golay', 'Savitzky-Golay polynomial smoothing'),
+    )
+
+    filter_selected_only : bpy.props.BoolProperty()
+    destutter_tolerance : bpy.props.FloatProperty(default=0, min=0, precision=4)
+    decimate_error : bpy.props.FloatProperty(default=0.005, min=0, precision=4)
+    decimate_on_save : bpy.props.BoolProperty(default=False)
+    filter_mode : bpy.props.EnumProperty(items=FILTER_ITEMS, default='WINDOW')
+    filter_samples : bpy.props.IntProperty(default=3, min=1)
+    filter_cutoff : bpy.props.FloatProperty(default=6, min=0.01) # hz
+    filter_order : bpy.props.IntProperty(default=2, min=1, max=8)
+    filter_falloff : bpy.props.EnumProperty(items=FALLOFF_ITEMS, default='SQUARE_INVERSE')
+    filter_bias : bpy.props.FloatProperty(default=0)
+    filter_scale : bpy.props.FloatProperty(default=1)
+
+    KEYFRAME_SOURCE_ITEMS = [
+        ('TIMELINE', 'Key On Timeline Frame', 'Key on current frame on the timeline'),
+        ('BROADCAST', 'Key On Broadcast Frame', 'Key on original broadcast timestamp'),
+    ]
+
+    def update_keyframe_source(self, context):
+        state.use_remote_timing = self.keyframe_source == 'BROADCAST'
+
+    keyframe_source : bpy.props.EnumProperty(
+        items=KEYFRAME_SOURCE_ITEMS,
+        default='TIMELINE', name='Keyframe Mode',
+        update=update_keyframe_source)
+
+    RESAMPLE_ITEMS = [
+        ('NONE', 'No Resampling', 'Key on the broadcast timestamps as they are'),
+        ('LINEAR', 'Resample Linear', 'Interpolate broadcast frames linearly onto whole frames'),
+        ('CUBIC', 'Resample Cubic', 'Interpolate broadcast frames with a smooth spline onto whole frames'),
+    ]
+
+    resample : bpy.props.EnumProperty(items=RESAMPLE_ITEMS, default='LINEAR', name='Resample')
+    resample_subframes : bpy.props.IntProperty(default=1, min=1, max=16, name='Subframes')
+
+    STREAM_FILTER_ITEMS = [
+        ('NONE', 'No Stream Filter', 'Store frames as received'),
+        ('ONE_EURO', 'One Euro', 'Speed adaptive low-pass'),
+        ('CRITICAL', 'Critically Damped', 'Critically damped spring'),
+    ]
+
+    stream_filter : bpy.props.EnumProperty(
+        items=STREAM_FILTER_ITEMS, default='NONE', name='Stream Filter',
+        update=update_stream_filter)
+    stream_min_cutoff : bpy.props.FloatVectorProperty(
+        size=len(STREAM_FILTER_GROUPS), default=[1.5] * len(STREAM_FILTER_GROUPS),
+        min=0, update=update_stream_filter)
+    stream_beta : bpy.props.FloatVectorProperty(
+        size=len(STREAM_FILTER_GROUPS), default=[0.5] * len(STREAM_FILTER_GROUPS),
+        min=0, update=update_stream_filter)
+
+    apply_neutral : bpy.props.BoolProperty(default=False, update=update_preview)
+    have_neutral : bpy.props.BoolProperty(default=False)
+    neutral1 : bpy.props.FloatVectorProperty(size=32, default=[0.0]*32, step=1, update=update_neutral)
+    neutral2 : bpy.props.FloatVectorProperty(size=30, default=[0.0]*30, step=1, update=update_neutral)
+
+    # ui display only
+
+    show_brow : bpy.props.BoolProperty()
+    show_eye : bpy.props.BoolProperty()
+    show_cheek : bpy.props.BoolProperty()
+    show_nose : bpy.props.BoolProperty()
+    show_jaw : bpy.props.BoolProperty()
+    show_mouth : bpy.props.BoolProperty()
+    show_tongue : bpy.props.BoolProperty()
+    show_neutral : bpy.props.BoolProperty()
+    show_stream_filter : bpy.props.BoolProperty()
+    show_actors : bpy.props.BoolProperty()
+
+
+class VisagePanelAnimation(bpy.types.Panel):
+    bl_idname = 'VS_PT_visage_anim'
+    bl_label = 'Animation'
+    bl_space_type = 'VIEW_3D'
+    bl_region_type = 'UI'
+    bl_category = 'Visage'
+
+    def draw(self, context):
+        wm = context.window_manager
+        prefs = context.preferences.addons['visage'].preferences
+        target = get_active_target(context)
+        layout = self.layout
+        col = layout.column(align=True)
+        row = col.row(align=True)
+        row.scale_y = 2
+        row.operator('vs.record', text='RECORD', depress=True if wm.visage_record else False)
+        row = col.row(align=True)
+        row.scale_y = 1.25
+        row.operator('vs.record_save', text='Save (%s)' % state.recording_length)
+        row.operator('vs.record_key', text='', icon='KEYFRAME')
+        row.operator('vs.record_clear', text='Clear')
+        row = col.row(align=True)
+        row.operator('vs.import_take', text='Import Take', icon='IMPORT')
+        self.layout.prop(prefs, 'frame_latency', text='Frame Latency')
+        source = context.scene.visage_target
+        self.layout.prop(source, 'keyframe_source', text='')
+        if source.keyframe_source == 'BROADCAST':
+            row = self.layout.row(align=True)
+            row.prop(source, 'resample', text='')
+            sub = row.row(align=True)
+            sub.enabled = source.resample != 'NONE'
+            sub.prop(source, 'resample_subframes', text='Subframes')
+        self.layout.prop(target, 'decimate_on_save', text='Decimate On Save')
+        if state.receiver and wm.visage_record and not state.use_remote_timing:
+            self.layout.label(text='Network Wait: %.1f ms' % (state.receiver.wait_time_avg * 1000))
+
+
+class VisagePanelData(bpy.types.Panel):
+    bl_idname = 'VS_PT_visage_data'
+    bl_label = 'Data'
+    bl_space_type = 'VIEW_3D'
+    bl_region_type = 'UI'
+    bl_category = 'Visage'
+
+    def draw(self, context):
+        wm = context.window_manager
+        prefs = context.preferences.addons['visage'].preferences
+        settings = get_active_target(context)
+
+        row = self.layout.row(align=True)
+        row.scale_y = 1.5
+        if wm.visage_preview:
+            row.operator('vs.preview', text='Preview', depress=True)
+        else:
+            row.operator('vs.preview', text='Preview', depress=False)
+        row.operator('vs.reset', text='Reset')
+
+        col = self.layout.column(align=True)
+        row = col.row(align=True)
+        row.scale_y = 1.25
+        if not state.is_receiver_running:
+            row.operator('vs.start', text='Receive', depress=False)
+        else:
+            row.operator('vs.stop', text='Receive', depress=True)
+        col.prop(prefs, 'port', text='Port')
+        col.prop(prefs, 'host', text='')
+
+        scene = context.scene
+        box = self.layout.box()
+        row = box.row()
+        visible = scene.visage_target.show_actors
+        if visible:
+            row.prop(scene.visage_target, 'show_actors', icon='DOWNARROW_HLT', text='', emboss=False)
+        else:
+            row.prop(scene.visage_target, 'show_actors', icon='RIGHTARROW', text='', emboss=False)
+        row.label(text='Actors (%d)' % (1 + len(scene.visage_actors)))
+        row.operator('vs.actor_add', text='', icon='ADD', emboss=False)
+        if visible:
+            col = box.column(align=True)
+            row = col.row(align=True)
+            op = row.operator('vs.actor_select', text='Default', depress=scene.visage_actor_index < 0)
+            op.index = -1
+            row.label(text='Port %d' % prefs.port)
+            for i, actor in enumerate(scene.visage_actors):
+                row = col.row(align=True)
+                row.prop(actor, 'enabled', text='')
+                op = row.operator('vs.actor_select', text=actor.name, depress=i == scene.visage_actor_index)
+                op.index = i
+                row.prop(actor, 'port', text='')
+                row.prop(actor, 'source', text='')
+                op = row.operator('vs.actor_remove', text='', icon='X')
+                op.index = i
+
+        box = self.layout.box()
+        row = box.row()
+        visible = settings.show_stream_filter
+        if visible:
+            row.prop(settings, 'show_stream_filter', icon='DOWNARROW_HLT', text='', emboss=False)
+        else:
+            row.prop(settings, 'show_stream_filter', icon='RIGHTARROW', text='', emboss=False)
+        row.prop(settings, 'stream_filter', text='')
+        if visible:
+            col = box.column(align=True)
+            col.enabled = settings.stream_filter != 'NONE'
+            for i, (label, start, count) in enumerate(STREAM_FILTER_GROUPS):
+                row = col.row(align=True)
+                split = row.split(factor=0.4, align=True)
+                row_a, row_b = split.row(align=True), split.row(align=True)
+                row_a.label(text=label.replace('_', ' ').title())
+                row_b.prop(settings, 'stream_min_cutoff', index=i, text='')
+                sub = row_b.row(align=True)
+                sub.enabled = settings.stream_filter == 'ONE_EURO'
+                sub.prop(settings, 'stream_beta', index=i, text='')
+
+
+class VisagePanelStats(bpy.types.Panel):
+    bl_idname = 'VS_PT_visage_stats'
+    bl_label = 'Stats'
+    bl_space_type = 'VIEW_3D'
+    bl_region_type = 'UI'
+    bl_category = 'Visage'
+    bl_options = {'DEFAULT_CLOSED'}
+
+    LABELS = [
+        ('transit', 'Transit', 'ms'),
+        ('decode', 'Decode', 'us'),
+        ('queue_depth', 'Queue', ''),
+        ('apply', 'Apply', 'ms'),
+        ('bake', 'Bake', 'ms'),
+    ]
+
+    def draw_header(self, context):
+        prefs = context.preferences.addons['visage'].preferences
+        self.layout.prop(prefs, 'stats_enabled', text='')
+
+    def draw(self, context):
+        stats = state.stats
+        layout = self.layout
+
+        row = layout.row(align=True)
+        row.operator('vs.stats_reset', text='Reset')
+        row.operator('vs.stats_dump', text='Dump', icon='EXPORT')
+
+        col = layout.column(align=True)
+        counters = stats.snapshot()['counters']
+        col.label(text='Packets: %d (%d frames, %d unknown)' % (
+            counters['packets'], counters['frames'], counters['unknown']))
+        col.label(text='Preview: %d ticks, %d idle, %d frames skipped' % (
+            counters['preview_ticks'], counters['preview_idle'], counters['preview_skipped']))
+        overflow = sum(a.input.buffer.overflow for a in state.actors.values())
+        col.label(text='Ring Overflow: %d' % overflow)
+
+        col = layout.column(align=True)
+        for name, label, unit in self.LABELS:
+            h = stats.histogram(name)
+            scale = 1e-3 if unit == 'ms' else 1
+            col.label(text='%s: %.2f avg  %.2f p95  %.2f max %s' % (
+                label, h['mean'] * scale, h['p95'] * scale, h['max'] * scale, unit))
+
+
+class VisagePanelActor(bpy.types.Panel):
+    bl_idname = 'VS_PT_visage_actor'
+    bl_label = 'Actor'
+    bl_space_type = 'VIEW_3D'
+    bl_region_type = 'UI'
+    bl_category = 'Visage'
+
+    def draw(self, context):
+        wm = context.window_manager
+        prefs = context.preferences.addons['visage'].preferences
+        settings = get_active_target(context)
+
+        row = self.layout.row(align=True)
+        row.scale_y = 1.5
+        icon = 'KEYFRAME_HLT' if settings.apply_neutral else 'KEYFRAME'
+        row.prop(settings, 'apply_neutral', text='', toggle=True, icon=icon)
+        # icon = 'CHECKBOX_HLT' if 'visage_neutral' in context.scene else 'CHECKBOX_DEHLT'
+        icon = 'CHECKBOX_HLT' if settings.have_neutral else 'CHECKBOX_DEHLT'
+        op = row.operator('vs.pose', text='Set Neutral', icon=icon)
+        op.reset = False
+        op = row.operator('vs.pose', text='', icon='X')
+        op.reset = True
+
+        box = self.layout.box()
+        row = box.row()
+        visible = settings.show_neutral
+        if visible:
+            row.prop(settings, 'show_neutral', icon='DOWNARROW_HLT', text='', emboss=False)
+        else:
+            row.prop(settings, 'show_neutral', icon='RIGHTARROW', text='', emboss=False)
+        row.label(text='Neutral Offsets')
+        if visible:
+            col = box.column(align=True)
+            for i in range(32):
+                col.prop(settings, 'neutral1', index=i, text=SHAPE_KEY_IDX_TO_NAME[i])
+            for i in range(20):
+                col.prop(settings, 'neutral2', index=i, text=SHAPE_KEY_IDX_TO_NAME[32 + i])
+            col.prop(settings, 'neutral2', index=52 - 32, text='Head Pos X')
+            col.prop(settings, 'neutral2', index=53 - 32, text='Head Pos Y')
+            col.prop(settings, 'neutral2', index=54 - 32, text='Head Pos Z')
+            col.prop(settings, 'neutral2', index=55 - 32, text='Head Rot X')
+            col.prop(settings, 'neutral2', index=56 - 32, text='Head Rot Y')
+            col.prop(settings, 'neutral2', index=57 - 32, text='Head Rot Z')
+            col.prop(settings, 'neutral2', index=58 - 32, text='Eye.L X')
+            col.prop(settings, 'neutral2', index=59 - 32, text='Eye.L Y')
+            col.prop(settings, 'neutral2', index=60 - 32, text='Eye.R X')
+            col.prop(settings, 'neutral2', index=61 - 32, text='Eye.R Y')
+
+        col = self.layout.column(align=True)
+        row = col.row(align=True)
+        row.scale_y = 1.25
+        op = row.operator('vs.neutral', text='Apply')
+        op.remove = False
+        op = row.operator('vs.neutral', text='Remove')
+        op.remove = True
+        box = col.box()
+        box.scale_y = .8
+        action_face = action_body =  None
+        tokens = []
+        if settings.face and settings.face.shape_keys:
+            anim_data = settings.face.shape_keys.animation_data
+            if anim_data:
+                action_face = anim_data.action
+                if action_face:
+                    box.label(text='Face: %s' % action_face.name)
+        if settings.armature:
+            anim_data = settings.armature.animation_data
+            if anim_data:
+                action_body = anim_data.action
+                if action_body:
+                    box.label(text='Body: %s' % action_body.name)
+
+
+
+class VisagePanelTarget(bpy.types.Panel):
+    bl_idname = 'VS_PT_visage_target'
+    bl_label = 'Target'
+    bl_space_type = 'VIEW_3D'
+    bl_region_type = 'UI'
+    bl_category = 'Visage'
+
+    def draw(self, context):
+        wm = context.window_manager
+        prefs = context.preferences.addons['visage'].preferences
+        settings = get_active_target(context)
+
+        col = self.layout.column(align=True)
+        col.prop(settings, 'face')
+        col.prop(settings, 'armature')
+        col.prop(settings, 'head')
+        col.prop(settings, 'eye_left')
+        col.prop(settings, 'eye_right')
+
+        self.layout.operator('vs.visage_shape_keys', text='Create Shape Keys')
+
+
+class VisagePanelKeys(bpy.types.Panel):
+    bl_idname = 'VS_PT_visage_keys'
+    bl_label = 'Parameters'
+    bl_space_type = 'VIEW_3D'
+    bl_region_type = 'UI'
+    bl_category = 'Visage'
+
+    def draw(self, context):
+        wm = context.window_manager
+        prefs = context.preferences.addons['visage'].preferences
+        settings = get_active_target(context)
+        layout = self.layout
+
+        col = layout.column()
+        col.prop(settings, 'mirror', text='')
+        col.prop(settings, 'head_pos_enabled', text='Head Position')
+        col.prop(settings, 'head_rot_enabled', text='Head Rotation')
+        r = col.row(align=True)
+        r.enabled = settings.head_rot_enabled
+        r.prop(settings, 'head_rot_min_max', index=0, text='')
+        r.prop(settings, 'head_rot_min_max', index=1, text='')
+        col.prop(settings, 'eyes_rot_enabled', text='Eye Rotation')
+        r = col.row(align=True)
+        r.enabled = settings.eyes_rot_enabled
+        r.prop(settings, 'eyes_rot_min_max', index=0, text='')
+        r.prop(settings, 'eyes_rot_min_max', index=1, text='')
+
+        col = layout.column(align=True)
+
+        for label, start, length in SHAPE_KEY_SETS:
+            box = col.box()
+            row = box.row()
+
+            attr_show = 'show_%s' % label
+            attr_enabled = '%s_enabled' % label
+            attr_sub_enabled = 'sub_%s_enabled' % label
+
+            visible = getattr(settings, attr_show)
+            if visible:
+                row.prop(settings, attr_show, icon='DOWNARROW_HLT', text='', emboss=False)
+            else:
+                row.prop(settings, attr_show, icon='RIGHTARROW', text='', emboss=False)
+            row.prop(settings, attr_enabled, text='')
+            row.label(text=label.capitalize())
+
+            if visible:
+                col_sub = box.column(align=True)
+                if not getattr(settings, attr_enabled):
+                    col_sub.enabled = False
+                for i in range(length):
+                    index = start + i
+
+                    if index < 32:
+                        attr_min = 'shape_min1'
+                        attr_max = 'shape_max1'
+                        offset = 0
+                    else:
+                        attr_min = 'shape_min2'
+                        attr_max = 'shape_max2'
+                        offset = 32
+
+                    row = col_sub.row(align=True)
+                    split = row.split(factor=0.5, align=True)
+                    row_a, row_b = split.row(align=True), split.row(align=True)
+                    min_max_index = index - offset
+                    row_a.label(text=SHAPE_KEYS[index][len(label):])
+                    row_a.prop(settings, attr_sub_enabled, index=i, text='')
+                    row_b.prop(settings, attr_min, index=min_max_index, text='')
+                    row_b.prop(settings, attr_max, index=min_max_index, text='')
+
+
+class VisagePanelFilter(bpy.types.Panel):
+    bl_idname = 'VS_PT_visage_filter'
+    bl_label = 'Filter'
+    bl_space_type = 'VIEW_3D'
+    bl_region_type = 'UI'
+    bl_category = 'Visage'
+
+    def draw(self, context):
+        wm = context.window_manager
+        prefs = context.preferences.addons['visage'].preferences
+        settings = get_active_target(context)
+        layout = self.layout
+
+        layout.prop(settings, 'filter_selected_only', text='Selected Curves Only')
+
+        col = layout.column(align=True)
+        op = col.column(align=True)
+        op.scale_y = 1.5
+        op.operator('vs.destutter', text='Destutter')
+        col.prop(settings, 'destutter_tolerance', text='Tolerance')
+
+        col = layout.column(align=True)
+        op = col.column(align=True)
+        op.scale_y = 1.5
+        op.operator('vs.decimate', text='Decimate')
+        col.prop(settings, 'decimate_error', text='Max Error')
+
+        col = layout.column(align=True)
+        op = col.column(align=True)
+        op.scale_y = 1.5
+        op.operator('vs.smooth', text='Smooth')
+        col.prop(settings, 'filter_mode', text='')
+        if settings.filter_mode == 'BUTTERWORTH':
+            col.prop(settings, 'filter_cutoff', text='Cutoff (Hz)')
+            col.prop(settings, 'filter_order', text='Order')
+        elif settings.filter_mode == 'SAVGOL':
+            col.prop(settings, 'filter_samples', text='Samples')
+            col.prop(settings, 'filter_order', text='Order')
+        else:
+            col.prop(settings, 'filter_falloff', text='')
+            col.prop(settings, 'filter_samples', text='Samples')
+            col.prop(settings, 'filter_bias', text='Bias')
+            col.prop(settings, 'filter_scale', text='Scale')
+
+
+class VisageStart(bpy.types.Operator):
+    bl_idname = 'vs.start'
+    bl_label = 'Start Visage Receiver'
+
+    def execute(self, context):
+        for error in state.start_receiver():
+            self.report({'WARNING'}, error)
+        state.load_neutral()
+        return {'FINISHED'}
+
+
+class VisageStop(bpy.types.Operator):
+    bl_idname = 'vs.stop'
+    bl_label = 'Stop Visage Receiver'
+
+    def execute(self, context):
+        state.stop_receiver()
+        return {'FINISHED'}
+
+
+class VisageActorAdd(bpy.types.Operator):
+    bl_idname = 'vs.actor_add'
+    bl_label = 'Add Visage Actor'
+    bl_options = {'REGISTER', 'UNDO'}
+
+    def execute(self, context):
+        scene = context.scene
+        ports = [state.prefs.port] + [a.port for a in scene.visage_actors]
+        actor = scene.visage_actors.add()
+        actor.name = 'Actor %d' % (len(scene.visage_actors) + 1)
+        actor.port = max(ports) + 1
+        scene.visage_actor_index = len(scene.visage_actors) - 1
+        if state.is_receiver_running:
+            for error in state.start_receiver():
+                self.report({'WARNING'}, error)
+        return {'FINISHED'}
+
+
+class VisageActorRemove(bpy.types.Operator):
+    bl_idname = 'vs.actor_remove'
+    bl_label = 'Remove Visage Actor'
+    bl_options = {'REGISTER', 'UNDO'}
+
+    index : bpy.props.IntProperty()
+
+    def execute(self, context):
+        scene = context.scene
+        state.remove_actor(self.index)
+        scene.visage_actors.remove(self.index)
+        if scene.visage_actor_index >= len(scene.visage_actors):
+            scene.visage_actor_index = len(scene.visage_actors) - 1
+        if state.is_receiver_running:
+            for error in state.start_receiver():
+                self.report({'WARNING'}, error)
+        return {'FINISHED'}
+
+
+class VisageActorSelect(bpy.types.Operator):
+    bl_idname = 'vs.actor_select'
+    bl_label = 'Edit Visage Actor'
+
+    index : bpy.props.IntProperty()
+
+    def execute(self, context):
+        context.scene.visage_actor_index = self.index
+        return {'FINISHED'}
+
+
+class VisageStatsReset(bpy.types.Operator):
+    bl_idname = 'vs.stats_reset'
+    bl_label = 'Reset Visage Stats'
+
+    def execute(self, context):
+        state.stats.reset()
+        redraw_areas()
+        return {'FINISHED'}
+
+
+class VisageStatsDump(bpy.types.Operator, ExportHelper):
+    bl_idname = 'vs.stats_dump'
+    bl_label = 'Dump Visage Stats'
+
+    filename_ext = '.json'
+    filter_glob : bpy.props.StringProperty(default='*.json', options={'HIDDEN'})
+
+    def execute(self, context):
+        try:
+            state.stats.dump(self.filepath)
+        except OSError as e:
+            self.report({'ERROR'}, str(e))
+            return {'CANCELLED'}
+        return {'FINISHED'}
+
+
+class VisagePose(bpy.types.Operator):
+    bl_idname = 'vs.pose'
+    bl_label = 'Set Neutral Face'
+
+    reset : bpy.props.BoolProperty(default=False)
+
+    def execute(self, context):
+        target = get_active_target(context)
+
+        actor = state.get_actor(target)
+
+        if self.reset:
+            target.neutral1 = [0.] * 32
+            target.neutral2 = [0.] * 30
+            actor.neutral = np.zeros(62)
+            target.have_neutral = False
+            # del context.scene['visage_neutral']
+        else:
+            neutral = actor.input.frame[:62]
+            target.neutral1 = neutral[:32]
+            target.neutral2 = neutral[32:62]
+            actor.neutral = np.array(neutral)
+            target.have_neutral = True
+            # context.scene['visage_neutral'] = state.neutral
+        return {'FINISHED'}
+
+
+class VisageReset(bpy.types.Operator):
+    bl_idname = 'vs.reset'
+    bl_label = 'Reset Visage Values'
+
+    def execute(self, context):
+        wm = context.window_manager
+        if wm.visage_preview:
+            bpy.ops.vs.preview()
+        target = get_active_target(context)
+        for shape in SHAPE_KEYS:
+            target.face.shape_keys.key_blocks[shape].value = 0
+        target.armature.pose.bones[target.head].rotation_euler = (0, 0, 0)
+        target.armature.pose.bones[target.eye_left].rotation_euler = (0, 0, 0)
+        target.armature.pose.bones[target.eye_right].rotation_euler = (0, 0, 0)
+        return {'FINISHED'}
+
+
+class VisagePreview(bpy.types.Operator):
+    bl_idname = 'vs.preview'
+    bl_label = 'Preview'
+
+    def execute(self, context):
+        wm = context.window_manager
+        wm.visage_preview = not wm.visage_preview
+        if wm.visage_preview:
+            for actor in state.actors.values():
+                actor.applied_mapping = None # the target may have changed meanwhile
+            state.preview_dirty = True
+        maybe_toggle_timer()
+        maybe_toggle_frame_change_handler()
+        state.load_neutral()
+        return {'FINISHED'}
+
+
+class VisageRecord(bpy.types.Operator):
+    bl_idname = 'vs.record'
+    bl_label = 'Record'
+
+    def execute(self, context):
+        wm = context.window_manager
+        if not state.receiver.is_running:
+            bpy.ops.vs.start()
+        wm.visage_record = not wm.visage_record
+        # if wm.visage_record and not wm.visage_preview:
+        #     bpy.ops.vs.preview()
+        # elif not wm.visage_record:
+        #     wm.visage_preview = False
+        maybe_toggle_timer()
+        maybe_toggle_frame_change_handler()
+        return {'FINISHED'}
+
+
+class VisageRecordKey(bpy.types.Operator):
+    bl_idname = 'vs.record_key'
+    bl_label = 'Record Single Keyframe'
+
+    def execute(self, context):
+        prefs = prefs = bpy.context.preferences.addons['visage'].preferences
+        for target in get_targets(context):
+            record_visage_data(target, prefs)
+        return {'FINISHED'}
+
+
+class VisageRecordSave(bpy.types.Operator):
+    bl_idname = 'vs.record_save'
+    bl_label = 'Save'
+
+    def execute(self, context):
+        wm = context.window_manager
+        prefs = prefs = bpy.context.preferences.addons['visage'].preferences
+        if wm.visage_record:
+            bpy.ops.vs.record()
+        for target in get_targets(context):
+            keyframe_visage_recording(target, prefs)
+        return {'FINISHED'}
+
+
+class VisageRecordClear(bpy.types.Operator):
+    bl_idname = 'vs.record_clear'
+    bl_label = 'Clear'
+
+    def execute(self, context):
+        # chunks already keyed while recording stay on the curves
+        for actor in state.actors.values():
+            actor.recording.clear()
+            actor.bake.steps.clear()
+            actor.bake.finish()
+        return {'FINISHED'}
+
+
+class VisageImportTake(bpy.types.Operator, ImportHelper):
+    bl_idname = 'vs.import_take'
+    bl_label = 'Import Visage Take'
+    bl_options = {'REGISTER', 'UNDO'}
+
+    filename_ext = TAKE_EXTENSION
+    filter_glob : bpy.props.StringProperty(default='*' + TAKE_EXTENSION, options={'HIDDEN'})
+
+    frame_start : bpy.props.IntProperty(default=1, name='Start Frame')
+    time_start : bpy.props.FloatProperty(default=0, min=0, name='From (seconds)')
+    time_end : bpy.props.FloatProperty(default=0, min=0, name='To (seconds, 0 for end)')
+    resample : bpy.props.EnumProperty(items=VisageTarget.RESAMPLE_ITEMS, default='LINEAR', name='Resample')
+    resample_subframes : bpy.props.IntProperty(default=1, min=1, max=16, name='Subframes')
+
+    @classmethod
+    def poll(cls, context):
+        return get_active_target(context).face is not None
+
+    def execute(self, context):
+        target = get_active_target(context)
+        fps = context.scene.render.fps / context.scene.render.fps_base
+
+        try:
+            info, records = read_take(self.filepath)
+        except (OSError, ValueError) as e:
+            self.report({'ERROR'}, str(e))
+            return {'CANCELLED'}
+
+        end = self.time_end if self.time_end > self.time_start else None
+        records = select_take_records(records, self.time_start, end)
+        if not len(records):
+            self.report({'WARNING'}, 'No frames in the selected range')
+            return {'CANCELLED'}
+
+        data = decode_take_records(records)
+        frames = self.frame_start + (data[:, 62] - self.time_start) * fps
+        frames, data = resample_frames(frames, data, 1. / self.resample_subframes, self.resample)
+        bake_visage_data(target, frames, data)
+
+        redraw_areas()
+
+        return {'FINISHED'}
+
+
+class VisageShapeKeys(bpy.types.Operator):
+    bl_idname = 'vs.visage_shape_keys'
+    bl_label = 'Create Visage Shape Keys'
+    bl_options = {'REGISTER', 'UNDO'}
+
+    @classmethod
+    def poll(cls, context):
+        return context.object and context.object.type == 'MESH'
+
+    def execute(self, context):
+        obj = context.object
+        if not obj.data.shape_keys or 'Basis' not in obj.data.shape_keys.key_blocks:
+            basis = obj.shape_key_add(name='Basis', from_mix=False)
+        else:
+            basis = obj.data.shape_keys.key_blocks['Basis']
+        for name in SHAPE_KEYS:
+            if name not in obj.data.shape_keys.key_blocks:
+                key = obj.shape_key_add(name=name, from_mix=False)
+                key.relative_key = basis
+        return {'FINISHED'}
+
+
+class VisageDestutter(bpy.types.Operator):
+    bl_idname = 'vs.destutter'
+    bl_label = 'Destutter Visage Curves'
+    bl_options = {'REGISTER', 'UNDO'}
+
+    @classmethod
+    def poll(cls, context):
+        return get_active_target(context).face is not None
+
+    def execute(self, context):
+        target = get_active_target(context)
+        curves = [c for a in get_visage_actions(target) for c in a.fcurves]
+        cos = [read_fcurve_co(c) for c in curves]
+
+        if not cos:
+            return {'CANCELLED'}
+
+        # frames x channels matrix over the union of keyed frames, nan where
+        # a channel has no key on that frame
+        frames = np.unique(np.concatenate([co[:, 0] for co in cos]))
+        rows = [np.searchsorted(frames, co[:, 0]) for co in cos]
+        values = np.full((len(frames), len(curves)), np.nan)
+        for i, co in enumerate(cos):
+            values[rows[i], i] = co[:, 1]
+
+        dupes = find_stutter_frames(values, target.destutter_tolerance)
+
+        for curve, co, row in zip(curves, cos, rows):
+            keep = ~dupes[row]
+            if not keep.all():
+                write_fcurve_co(curve, co[keep])
+
+        redraw_areas()
+
+        return {'FINISHED'}
+
+
+class VisageDecimate(bpy.types.Operator):
+    bl_idname = 'vs.decimate'
+    bl_label = 'Decimate Visage Curves'
+    bl_options = {'REGISTER', 'UNDO'}
+
+    @classmethod
+    def poll(cls, context):
+        return get_active_target(context).face is not None
+
+    def execute(self, context):
+        target = get_active_target(context)
+
+        for action in get_visage_actions(target):
+            for curve in action.fcurves:
+                if target.filter_selected_only:
+                    if not curve.select:
+                        continue
+                decimate_fcurve(curve, target.decimate_error)
+
+        redraw_areas()
+
+        return {'FINISHED'}
+
+
+class VisageSmooth(bpy.types.Operator):
+    bl_idname = 'vs.smooth'
+    bl_label = 'Smooth Visage Curves'
+    bl_options = {'REGISTER', 'UNDO'}
+
+    @classmethod
+    def poll(cls, context):
+        return get_active_target(context).face is not None
+
+    def execute(self, context):
+        target = get_active_target(context)
+        action = target.face.shape_keys.animation_data.action
+        fps = context.scene.render.fps
+
+        curves = []
+        for curve in action.fcurves:
+            if target.filter_selected_only:
+                if not curve.select:
+                    continue
+            if len(curve.keyframe_points) > 1:
+                curves.append(curve)
+
+        # curves of equal length are filtered together as one matrix
+        batches = {}
+        for curve in curves:
+            batches.setdefault(len(curve.keyframe_points), []).append(curve)
+
+        for batch in batches.values():
+            co = np.stack([read_fcurve_co(c) for c in batch])
+            co = self.smooth(target, co, fps)
+            co[:, 0, 0] = np.round(co[:, 0, 0])
+            co[:, -1, 0] = np.round(co[:, -1, 0])
+            for curve, points in zip(batch, co):
+                curve.keyframe_points.foreach_set('co', points.ravel())
+                curve.update()
+
+        redraw_areas()
+
+        return {'FINISHED'}
+
+    def smooth(self, target, co, fps):
+        # co is (curves, keys, 2)
+        samples = target.filter_samples
+        mode = target.filter_mode
+        x, y = co[..., 0], co[..., 1]
+
+        if mode == 'BUTTERWORTH':
+            spacing = np.median(np.diff(x[0])) / fps # seconds between keys
+            cutoff = min(target.filter_cutoff * spacing, 0.5)
+            co[..., 1] = filter_butterworth(y, cutoff, target.filter_order)
+        elif mode == 'SAVGOL':
+            co[..., 1] = filter_savgol(y, samples, target.filter_order)
+        else:
+            v = np.clip(remap(y, target.filter_bias, target.filter_scale), 0, 1)
+            f = FILTER_FALLOFF[target.filter_falloff](v)
+            co[..., 0] = lerp(x, filter_window(x, samples), f)
+            co[..., 1] = lerp(y, filter_window(y, samples), f)
+
+        return co
+
+
+class VisageNeutral(bpy.types.Operator):
+    bl_idname = 'vs.neutral'
+    bl_label = 'Apply Neutral Pose'
+    bl_options = {'REGISTER', 'UNDO'}
+
+    remove : bpy.props.BoolProperty(default=False)
+    use_range : bpy.props.BoolProperty(default=False, name='Frame Range')
+    frame_start : bpy.props.IntProperty(default=1, name='Start')
+    frame_end : bpy.props.IntProperty(default=250, name='End')
+
+    @classmethod
+    def poll(cls, context):
+        return get_active_target(context).face is not None
+
+    def execute(self, context):
+        target = get_active_target(context)
+        actor = state.get_actor(target)
+        actor.load_neutral(target)
+        offsets = get_neutral_offsets(target, actor.neutral)
+        sign = 1 if self.remove else -1
+        start, end = (self.frame_start, self.frame_end) if self.use_range else (None, None)
+
+        for action in get_visage_actions(target):
+            for curve in action.fcurves:
+                if target.filter_selected_only:
+                    if not curve.select:
+                        continue
+                offset = offsets.get((curve.data_path, curve.array_index))
+                if offset:
+                    shift_fcurve(curve, offset * sign, start, end)
+
+        redraw_areas()
+
+        return {'FINISHED'}
+
+
+__REGISTER_CLASSES__ = (
+    VisagePreferences,
+    VisageTarget,
+    VisagePanelAnimation,
+    VisagePanelData,
+    VisagePanelStats,
+    VisagePanelActor,
+    VisagePanelTarget,
+    VisagePanelKeys,
+    VisagePanelFilter,
+    VisageStart,
+    VisageStop,
+    VisageActorAdd,
+    VisageActorRemove,
+    VisageActorSelect,
+    VisageStatsReset,
+    VisageStatsDump,
+    VisagePose,
+    VisageReset,
+    VisagePreview,
+    VisageRecord,
+    VisageRecordKey,
+    VisageRecordSave,
+    VisageRecordClear,
+    VisageImportTake,
+    VisageShapeKeys,
+    VisageDestutter,
+    VisageDecimate,
+    VisageSmooth,
+    VisageNeutral,
+)
+
+
+__REGISTER_PROPS__ = (
+    (bpy.types.Scene, 'visage_target', bpy.props.PointerProperty(type=VisageTarget)),
+    (bpy.types.Scene, 'visage_actors', bpy.props.CollectionProperty(type=VisageTarget)),
+    (bpy.types.Scene, 'visage_actor_index', bpy.props.IntProperty(default=-1)),
+    (bpy.types.WindowManager, 'visage_preview', bpy.props.BoolProperty()),
+    (bpy.types.WindowManager, 'visage_record', bpy.props.BoolProperty()),
+)
+
+
+@bpy.app.handlers.persistent
+def handler_depsgraph_update_post(scene, depsgraph):
+    # shape keys or bones may have been added, removed or renamed; only the
+    # mappings built on an updated id are dropped, curves are checked by
+    # `VisageMapping.fcurve` so the add-on's own keying costs no rebuild
+    if not (depsgraph.id_type_updated('KEY') or depsgraph.id_type_updated('ARMATURE')):
+        return
+    updated = {u.id.original.as_pointer() for u in depsgraph.updates
+        if isinstance(u.id, (bpy.types.Key, bpy.types.Armature, bpy.types.Object))}
+    for actor in state.actors.values():
+        if actor.mapping is not None and not updated.isdisjoint(actor.mapping.ids):
+            actor.mapping = None
+
+
+@bpy.app.handlers.persistent
+def handler_load_pre(*args):
+    if state is not None:
+        state.stop_receiver()
+        state.actors.clear()
+
+    if handler_frame_change_post in bpy.app.handlers.frame_change_post:
+        bpy.app.handlers.frame_change_post.remove(handler_frame_change_post)
+
+    if bpy.app.timers.is_registered(timer_update):
+        bpy.app.timers.unregister(timer_update)
+
+
+def register():
+    global state
+
+    if state is None:
+        state = VisageState()
+
+    for cls in __REGISTER_CLASSES__:
+        bpy.utils.register_class(cls)
+
+    for obj, prop, value in __REGISTER_PROPS__:
+        setattr(obj, prop, value)
+
+    bpy.app.handlers.load_pre.append(handler_load_pre)
+    bpy.app.handlers.depsgraph_update_post.append(handler_depsgraph_update_post)
+
+
+def unregister():
+    if state is not None:
+        state.stop_receiver()
+
+    for cls in __REGISTER_CLASSES__:
+        bpy.utils.unregister_class(cls)
+
+    for cls, prop, value in __REGISTER_PROPS__:
+        delattr(cls, prop)
+
+    bpy.app.handlers.load_pre.remove(handler_load_pre)
+    bpy.app.handlers.depsgraph_update_post.remove(handler_depsgraph_update_post)
@@ -0,0 +1,49 @@
+# headless capture from a port to a take file, no blender needed:
+#
+#   python -m visage.capture --port 8080 takes/session.vtake
+
+import time
+import argparse
+
+from .core import VisageChannel, VisageInput, VisageReceiver, VisageTakeWriter
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m visage.capture',
+        description='Capture Visage OSC frames to a take file.')
+    parser.add_argument('path', help='take file to write')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--fps', type=float, default=60., help='frame rate stored in the take header')
+    parser.add_argument('--quantize', action='store_true', help='store blendshapes as 16 bit')
+    parser.add_argument('--duration', type=float, default=0, help='seconds to capture, 0 until interrupted')
+    args = parser.parse_args(argv)
+
+    # a receiver thread, so ctrl-c reaches only this process and the take
+    # is closed cleanly
+    input = VisageInput(fork=False)
+    take = VisageTakeWriter(args.path, args.fps, args.quantize)
+    try:
+        take.open()
+    except OSError as e:
+        parser.error('cannot write take: %s' % e)
+    channel = VisageChannel('capture', args.port, input, take=take)
+    receiver = VisageReceiver(args.host, [channel], fork=False)
+    receiver.start()
+
+    start = time.monotonic()
+    try:
+        while not args.duration or time.monotonic() - start < args.duration:
+            time.sleep(1)
+            print('\r%d frames' % input.status[2], end='', flush=True)
+    except KeyboardInterrupt:
+        pass
+    print()
+
+    receiver.stop()
+    receiver.process.join()
+
+
+if __name__ == '__main__':
+    main()
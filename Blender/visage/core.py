@@ -0,0 +1,1217 @@
+# capture core of the add-on, free of bpy so the receiver, take files and
+# curve math can run, be profiled or be tested outside of Blender
+
+import os
+import json
+import time
+import math
+import bisect
+import struct
+import socket
+import selectors
+import threading
+import multiprocessing
+import numpy as np
+
+
+mp = multiprocessing.get_context('fork')
+
+
+RING_CAPACITY = 60 * 60 # one minute of frames at 60 fps
+
+
+# wire format of `/visage float[63]`: padded address, padded type tags, payload
+VISAGE_PACKET_PREFIX = b'/visage\0' + b',' + b'f' * 63 + b'\0' * 4
+VISAGE_PACKET_STRUCT = struct.Struct('>63f')
+VISAGE_PACKET_SIZE = len(VISAGE_PACKET_PREFIX) + VISAGE_PACKET_STRUCT.size
+
+_PACKET_PREFIX_BYTES = np.frombuffer(VISAGE_PACKET_PREFIX, np.uint8)
+
+# several frames per datagram: an OSC bundle of `/visage` messages, or
+# `/visage/q blob` with records of quantized weights in [0, 1], float
+# transforms and a double timestamp, big-endian like the rest of OSC
+VISAGE_BUNDLE_PREFIX = b'#bundle\0'
+VISAGE_BUNDLE_HEADER_SIZE = 16 # prefix and time tag
+VISAGE_BUNDLE_ELEMENT = np.dtype([
+    ('size', '>i4'),
+    ('prefix', 'u1', len(VISAGE_PACKET_PREFIX)),
+    ('values', '>f4', 63),
+])
+VISAGE_COMPACT_PREFIX = b'/visage/q\0\0\0' + b',b\0\0'
+VISAGE_COMPACT_RECORD = np.dtype([('time', '>f8'), ('weights', '>u2', 52), ('transforms', '>f4', 10)])
+
+
+SHAPE_KEYS = [
+    'BrowInnerUp',
+    'BrowDownLeft',
+    'BrowDownRight',
+    'BrowOuterUpLeft',
+    'BrowOuterUpRight',
+    'EyeLookUpLeft',
+    'EyeLookUpRight',
+    'EyeLookDownLeft',
+    'EyeLookDownRight',
+    'EyeLookInLeft',
+    'EyeLookInRight',
+    'EyeLookOutLeft',
+    'EyeLookOutRight',
+    'EyeBlinkLeft',
+    'EyeBlinkRight',
+    'EyeSquintLeft',
+    'EyeSquintRight',
+    'EyeWideLeft',
+    'EyeWideRight',
+    'CheekPuff',
+    'CheekSquintLeft',
+    'CheekSquintRight',
+    'NoseSneerLeft',
+    'NoseSneerRight',
+    'JawOpen',
+    'JawForward',
+    'JawLeft',
+    'JawRight',
+    'MouthFunnel',
+    'MouthPucker',
+    'MouthLeft',
+    'MouthRight',
+    'MouthRollUpper',
+    'MouthRollLower',
+    'MouthShrugUpper',
+    'MouthShrugLower',
+    'MouthClose',
+    'MouthSmileLeft',
+    'MouthSmileRight',
+    'MouthFrownLeft',
+    'MouthFrownRight',
+    'MouthDimpleLeft',
+    'MouthDimpleRight',
+    'MouthUpperUpLeft',
+    'MouthUpperUpRight',
+    'MouthLowerDownLeft',
+    'MouthLowerDownRight',
+    'MouthPressLeft',
+    'MouthPressRight',
+    'MouthStretchLeft',
+    'MouthStretchRight',
+    'TongueOut',
+]
+
+
+SHAPE_KEY_IDX_TO_NAME = {}
+for i, n in enumerate(SHAPE_KEYS):
+    SHAPE_KEY_IDX_TO_NAME[i] = n
+
+
+SHAPE_KEY_NAME_TO_IDX = {}
+for i, n in enumerate(SHAPE_KEYS):
+    SHAPE_KEY_NAME_TO_IDX[n] = i
+
+
+SHAPE_KEYS_MIRROR_LEFT = {}
+for n in SHAPE_KEYS:
+    if n.endswith('Left'):
+        m = n.replace('Left', 'Right')
+        SHAPE_KEYS_MIRROR_LEFT[n] = SHAPE_KEYS[SHAPE_KEYS.index(m)]
+    elif n.endswith('Right'):
+        pass
+    else:
+        SHAPE_KEYS_MIRROR_LEFT[n] = n
+
+
+SHAPE_KEYS_MIRROR_RIGHT = {}
+for n in SHAPE_KEYS:
+    if n.endswith('Right'):
+        m = n.replace('Right', 'Left')
+        SHAPE_KEYS_MIRROR_RIGHT[n] = SHAPE_KEYS[SHAPE_KEYS.index(m)]
+    elif n.endswith('Left'):
+        pass
+    else:
+        SHAPE_KEYS_MIRROR_RIGHT[n] = n
+
+
+SHAPE_KEY_SETS = [
+    ('brow', 0, 5),
+    ('eye', 5, 14),
+    ('cheek', 19, 3),
+    ('nose', 22, 2),
+    ('jaw', 24, 4),
+    ('mouth', 28, 23),
+    ('tongue', 51, 1),
+]
+
+
+TRANSFORM_SETS = [
+    ('head_pos', 52, 3),
+    ('head_rot', 55, 3),
+    ('eyes', 58, 4),
+]
+
+
+STREAM_FILTER_GROUPS = SHAPE_KEY_SETS + TRANSFORM_SETS
+STREAM_FILTER_MODES = ['NONE', 'ONE_EURO', 'CRITICAL']
+RESAMPLE_MODES = ['NONE', 'LINEAR', 'CUBIC']
+ROTATION_CHANNELS = slice(55, 62) # head and eye euler angles in degrees
+
+
+SHAPE_KEY_GROUP = {}
+for i, n in enumerate(SHAPE_KEYS):
+    for group, start, count in SHAPE_KEY_SETS:
+        if i >= start and i < (start + count):
+            SHAPE_KEY_GROUP[n] = group.capitalize()
+
+
+def _mirror_permutation(mirror):
+    # index permutation so that `weights[perm]` copies sources onto their mirrors
+    perm = np.arange(len(SHAPE_KEYS))
+    for n, m in mirror.items():
+        perm[SHAPE_KEY_NAME_TO_IDX[m]] = SHAPE_KEY_NAME_TO_IDX[n]
+    return perm
+
+
+SHAPE_KEYS_MIRROR_PERM = {
+    'NONE': np.arange(len(SHAPE_KEYS)),
+    'LEFT': _mirror_permutation(SHAPE_KEYS_MIRROR_LEFT),
+    'RIGHT': _mirror_permutation(SHAPE_KEYS_MIRROR_RIGHT),
+}
+
+
+del i, n, m, group, start, count # tidying
+
+
+# take files: a header then fixed-size records of raw frames, so a file cut
+# short by a crash is still readable up to its last whole record
+TAKE_EXTENSION = '.vtake'
+TAKE_MAGIC = b'VSGTAKE\0'
+TAKE_VERSION = 1
+TAKE_HEADER = struct.Struct('<8sHHHHddd24x') # magic, version, encoding, weights, transforms, fps, start, created
+TAKE_ENCODING_RAW = 0
+TAKE_ENCODING_QUANTIZED = 1 # weights as 16 bit fractions of [0, 1]
+TAKE_RECORD_DTYPES = [
+    np.dtype([('time', '<f8'), ('weights', '<f4', 52), ('transforms', '<f4', 10)]),
+    np.dtype([('time', '<f8'), ('weights', '<u2', 52), ('transforms', '<f4', 10)]),
+]
+
+
+def decode_visage_packet(packet):
+    # fast path for the fixed visage message, None for anything else
+    if len(packet) == VISAGE_PACKET_SIZE and packet.startswith(VISAGE_PACKET_PREFIX):
+        return VISAGE_PACKET_STRUCT.unpack_from(packet, len(VISAGE_PACKET_PREFIX))
+    return None
+
+
+def encode_visage_packet(values):
+    return VISAGE_PACKET_PREFIX + VISAGE_PACKET_STRUCT.pack(*values)
+
+
+def decode_visage_frames(packet):
+    # frames of a bundle or compact message as one (n, 63) array, None for
+    # anything else; bundles of only `/visage` messages take a single
+    # vectorized pass
+    if packet.startswith(VISAGE_BUNDLE_PREFIX):
+        body = len(packet) - VISAGE_BUNDLE_HEADER_SIZE
+        if body > 0 and body % VISAGE_BUNDLE_ELEMENT.itemsize == 0:
+            elements = np.frombuffer(packet, VISAGE_BUNDLE_ELEMENT, offset=VISAGE_BUNDLE_HEADER_SIZE)
+            if ((elements['size'] == VISAGE_PACKET_SIZE).all()
+                and (elements['prefix'] == _PACKET_PREFIX_BYTES).all()):
+                return elements['values'].astype(np.float64)
+        return _decode_visage_bundle(packet)
+
+    if packet.startswith(VISAGE_COMPACT_PREFIX):
+        offset = len(VISAGE_COMPACT_PREFIX) + 4
+        if len(packet) < offset:
+            return None
+        size = int.from_bytes(packet[offset - 4:offset], 'big', signed=True)
+        if size <= 0 or size % VISAGE_COMPACT_RECORD.itemsize or len(packet) < offset + size:
+            return None
+        records = np.frombuffer(packet, VISAGE_COMPACT_RECORD, size // VISAGE_COMPACT_RECORD.itemsize, offset)
+        data = np.empty((len(records), 63))
+        data[:, :52] = records['weights'] / 65535.
+        data[:, 52:62] = records['transforms']
+        data[:, 62] = records['time']
+        return data
+
+    return None
+
+
+def _decode_visage_bundle(packet):
+    # element by element for mixed or nested bundles, elements that are not
+    # frames are skipped
+    frames = []
+    offset = VISAGE_BUNDLE_HEADER_SIZE
+    while offset + 4 <= len(packet):
+        size = int.from_bytes(packet[offset:offset + 4], 'big', signed=True)
+        element = packet[offset + 4:offset + 4 + size]
+        offset += 4 + size
+        if size <= 0 or len(element) < size:
+            break
+        values = decode_visage_packet(element)
+        if values is not None:
+            frames.append(np.array(values)[None])
+            continue
+        data = decode_visage_frames(element)
+        if data is not None:
+            frames.append(data)
+    if not frames:
+        return None
+    return np.concatenate(frames)
+
+
+def encode_visage_bundle(frames):
+    # (n, 63) frames as a bundle of `/visage` messages, time tag immediately
+    elements = np.empty(len(frames), VISAGE_BUNDLE_ELEMENT)
+    elements['size'] = VISAGE_PACKET_SIZE
+    elements['prefix'] = _PACKET_PREFIX_BYTES
+    elements['values'] = frames
+    return VISAGE_BUNDLE_PREFIX + (1).to_bytes(8, 'big') + elements.tobytes()
+
+
+def encode_visage_compact(frames):
+    # (n, 63) frames as one `/visage/q` message, weights clipped to [0, 1]
+    records = np.empty(len(frames), VISAGE_COMPACT_RECORD)
+    records['time'] = frames[:, 62]
+    records['weights'] = np.rint(np.clip(frames[:, :52], 0, 1) * 65535)
+    records['transforms'] = frames[:, 52:62]
+    return VISAGE_COMPACT_PREFIX + records.nbytes.to_bytes(4, 'big') + records.tobytes()
+
+
+def encode_take_records(data, encoding, start=0.):
+    # (n, 63) frames to take records, times relative to `start`
+    records = np.empty(len(data), dtype=TAKE_RECORD_DTYPES[encoding])
+    records['time'] = data[:, 62] - start
+    records['transforms'] = data[:, 52:62]
+    if encoding == TAKE_ENCODING_QUANTIZED:
+        records['weights'] = np.rint(np.clip(data[:, :52], 0, 1) * 65535)
+    else:
+        records['weights'] = data[:, :52]
+    return records
+
+
+def decode_take_records(records):
+    # take records back to (n, 63) frames, times relative to the take start
+    data = np.empty((len(records), 63))
+    data[:, 62] = records['time']
+    data[:, 52:62] = records['transforms']
+    if records.dtype == TAKE_RECORD_DTYPES[TAKE_ENCODING_QUANTIZED]:
+        data[:, :52] = records['weights'] / 65535.
+    else:
+        data[:, :52] = records['weights']
+    return data
+
+
+def read_take(path):
+    # memory-maps a take file, trailing partial records are ignored
+    with open(path, 'rb') as f:
+        header = f.read(TAKE_HEADER.size)
+    if len(header) < TAKE_HEADER.size:
+        raise ValueError('Not a Visage take: %s' % path)
+    magic, version, encoding, weights, transforms, fps, start, created = TAKE_HEADER.unpack(header)
+    if magic != TAKE_MAGIC or version != TAKE_VERSION or encoding >= len(TAKE_RECORD_DTYPES):
+        raise ValueError('Not a Visage take: %s' % path)
+    dtype = TAKE_RECORD_DTYPES[encoding]
+    count = (os.path.getsize(path) - TAKE_HEADER.size) // dtype.itemsize
+    if count:
+        records = np.memmap(path, dtype=dtype, mode='r', offset=TAKE_HEADER.size, shape=(count,))
+    else:
+        records = np.empty(0, dtype=dtype)
+    info = {'encoding': encoding, 'fps': fps, 'start': start, 'created': created}
+    return info, records
+
+
+def write_take(path, data, fps, encoding=TAKE_ENCODING_RAW, start=0., created=None):
+    # whole (n, 63) frames to a take file at once, times relative to `start`
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(TAKE_HEADER.pack(
+            TAKE_MAGIC, TAKE_VERSION, encoding, 52, 10,
+            fps, start, time.time() if created is None else created))
+        f.write(encode_take_records(data, encoding).tobytes())
+
+
+def select_take_records(records, start=0., end=None):
+    # records within [start, end) seconds, found by binary search on time;
+    # packets reordered on the network leave the times out of order, those
+    # takes are masked instead
+    times = records['time']
+    if (np.diff(times) < 0).any():
+        keep = times >= start
+        if end is not None:
+            keep &= times < end
+        return records[keep]
+    lo = np.searchsorted(times, start, side='left')
+    hi = len(records) if end is None else np.searchsorted(times, end, side='left')
+    return records[lo:hi]
+
+
+def lerp(a, b, v):
+    return a * (1 - v) + b * v
+
+
+def smoothing_alpha(dt, cutoff):
+    # exponential smoothing factor of a first order low-pass at `cutoff` hz
+    r = 2 * math.pi * cutoff * dt
+    return r / (r + 1)
+
+
+def remap(v, b, s):
+    # return (v - b) * s
+    return v * s + b
+
+
+def find_stutter_frames(values, tolerance=0.):
+    # rows of a frames x channels matrix where every key matches the
+    # previous row, channels without a key (nan) on a row are ignored
+    this = values[1:]
+    prev = values[:-1]
+    same = (np.abs(this - prev) <= tolerance) | np.isnan(this)
+    return np.concatenate(([False], same.all(axis=1)))
+
+
+FILTER_FALLOFF = {
+    'UNIFORM': lambda x: np.ones_like(x),
+    'LINEAR': lambda x: x,
+    'SQUARE': lambda x: x**2,
+    'SQUARE_INVERSE': lambda x: 1 - (1 - x)**2,
+    'SMOOTH': lambda x: np.cos(x * np.pi + np.pi) / 2 + 0.5,
+    'SMOOTH_X2': lambda x: np.cos(np.clip(x * 2, 0, 1) * np.pi + np.pi) / 2 + 0.5,
+}
+
+
+def pad_edges(values, pad, mode='edge'):
+    # pads the last axis, `odd` mirrors around the end points to keep slopes
+    if mode == 'odd':
+        pad = min(pad, values.shape[-1] - 1)
+        head = 2 * values[..., :1] - values[..., pad:0:-1]
+        tail = 2 * values[..., -1:] - values[..., -2:-pad - 2:-1]
+        return np.concatenate((head, values, tail), axis=-1)
+    widths = [(0, 0)] * (values.ndim - 1) + [(pad, pad)]
+    return np.pad(values, widths, mode=mode)
+
+
+def filter_window(values, samples):
+    # moving average over 2 * samples + 1 keys along the last axis
+    size = samples * 2 + 1
+    total = np.cumsum(pad_edges(values, samples), axis=-1)
+    total = np.concatenate((np.zeros(values.shape[:-1] + (1,)), total), axis=-1)
+    average = (total[..., size:] - total[..., :-size]) / size
+    return average
+
+
+def filter_butterworth(values, cutoff, order=2):
+    # zero-phase low-pass with the magnitude response of a butterworth filter
+    # run forward and backward, `cutoff` in cycles per sample
+    count = values.shape[-1]
+    pad = min(count - 1, int(math.ceil(3 / max(cutoff, 1e-6))))
+    # the line through the end points is removed so the padded signal wraps
+    # around without a step
+    trend = lerp(values[..., :1], values[..., -1:], np.linspace(0, 1, count))
+    padded = pad_edges(values - trend, pad, 'odd')
+    freqs = np.fft.rfftfreq(padded.shape[-1])
+    gain = 1 / (1 + (freqs / cutoff)**(2 * order))
+    filtered = np.fft.irfft(np.fft.rfft(padded, axis=-1) * gain, padded.shape[-1], axis=-1)
+    return filtered[..., pad:pad + count] + trend
+
+
+def filter_savgol(values, samples, order=2):
+    # savitzky-golay smoothing over 2 * samples + 1 keys along the last axis,
+    # narrowed on curves too short to mirror a full window around their ends
+    count = values.shape[-1]
+    samples = max(min(samples, count - 1), 0)
+    size = samples * 2 + 1
+    order = min(order, size - 1)
+    x = np.arange(-samples, samples + 1)
+    coeffs = np.linalg.pinv(np.vander(x, order + 1, increasing=True))[0]
+    padded = pad_edges(values, samples, 'odd')
+    filtered = np.zeros_like(values)
+    for i, c in enumerate(coeffs):
+        filtered += c * padded[..., i:i + count]
+    return filtered
+
+
+def cubic_bezier(u, p0, p1, p2, p3):
+    v = 1 - u
+    return v**3 * p0 + 3 * v**2 * u * p1 + 3 * v * u**2 * p2 + u**3 * p3
+
+
+def decimate_keys(x, y, slope, max_error):
+    # indices of the keys to keep so that bezier segments between them, with
+    # handles at thirds along `slope`, stay within `max_error` of every
+    # dropped key; segments are split at their worst key until they fit
+    count = len(x)
+    keep = np.zeros(count, dtype=bool)
+    keep[[0, -1]] = True
+    spans = [(0, count - 1)]
+    while spans:
+        i, j = spans.pop()
+        if j - i < 2:
+            continue
+        dx = x[j] - x[i]
+        u = (x[i + 1:j] - x[i]) / dx
+        fit = cubic_bezier(u, y[i], y[i] + slope[i] * dx / 3, y[j] - slope[j] * dx / 3, y[j])
+        error = np.abs(fit - y[i + 1:j])
+        k = np.argmax(error)
+        if error[k] > max_error:
+            k += i + 1
+            keep[k] = True
+            spans.append((i, k))
+            spans.append((k, j))
+    return np.flatnonzero(keep)
+
+
+def resolve_frames(frames, data):
+    # rows sorted by frame, keeping the last one recorded on each frame
+    order = np.argsort(frames, kind='stable')
+    frames = frames[order]
+    last = np.append(frames[1:] != frames[:-1], True)
+    return frames[last], data[order][last]
+
+
+def unwrap_rotations(data):
+    # rotation channels (degrees) made continuous down the rows, so they
+    # interpolate the short way around
+    data = np.array(data, dtype=np.float64)
+    data[:, ROTATION_CHANNELS] = np.degrees(np.unwrap(np.radians(data[:, ROTATION_CHANNELS]), axis=0))
+    return data
+
+
+def resample_frames(frames, data, step=1., mode='LINEAR'):
+    # interpolates rows of `data` sampled at `frames` (phone timing) onto
+    # every `step` frames between them, all channels at once; rows are sorted
+    # first, keeping the last of repeated frames, and rotations unwrapped so
+    # they turn the short way around
+    frames = np.asarray(frames, dtype=np.float64)
+    data = np.array(data, dtype=np.float64)
+    if not len(frames):
+        return frames, data
+    frames, data = resolve_frames(frames, data)
+    if len(frames) < 2 or mode == 'NONE':
+        return frames, data
+    data = unwrap_rotations(data)
+
+    grid = np.arange(math.ceil(frames[0] / step), math.floor(frames[-1] / step) + 1) * step
+    i = np.clip(np.searchsorted(frames, grid, side='right') - 1, 0, len(frames) - 2)
+    span = frames[i + 1] - frames[i]
+    u = ((grid - frames[i]) / span)[:, None]
+    y0, y1 = data[i], data[i + 1]
+
+    if mode == 'CUBIC':
+        # hermite spline through the samples, slopes from their neighbours
+        slope = np.gradient(data, frames, axis=0)
+        m0 = slope[i] * span[:, None]
+        m1 = slope[i + 1] * span[:, None]
+        u2, u3 = u**2, u**3
+        values = ((2 * u3 - 3 * u2 + 1) * y0 + (u3 - 2 * u2 + u) * m0
+            + (3 * u2 - 2 * u3) * y1 + (u3 - u2) * m1)
+    else:
+        values = lerp(y0, y1, u)
+
+    return grid, values
+
+
+class VisageInput:
+    # buffers shared between a receiver and the code consuming its frames
+
+    '''
+    `status`:
+        0:  receiving, thread/fork is running
+        1:  recording, queueing up frames for remote timing
+        2:  frames received counter
+
+    `event`:
+        set by the receiver on every new frame, cleared by waiters, may be
+        shared by several inputs
+
+    `timing`:
+        0: recording start (seconds on timeline)
+        1: recording start (broadcast uptime)
+
+    `frame`:
+        the latest frame data received
+
+    `buffer`:
+        ring buffer of received frame data when using remote timing
+
+    `filter`:
+        online smoothing applied by the receiver before frames are stored
+    '''
+
+    def __init__(self, fork, event=None):
+        if fork:
+            self.status = mp.Array('i', [0, 0, 0], lock=False)
+            self.timing = mp.Array('d', [0, 0], lock=False)
+            self.frame = mp.Array('d', [0] * 63, lock=False)
+            self.event = event or mp.Event()
+        else:
+            self.status = [0, 0, 0]
+            self.timing = [0, 0]
+            self.frame = [0] * 63
+            self.event = event or threading.Event()
+
+        self.buffer = VisageRingBuffer(RING_CAPACITY, 63)
+        self.filter = VisageStreamFilter(62)
+
+
+class VisageRingBuffer:
+    # single producer, single consumer ring of fixed-size frames
+
+    '''
+    `slots`:
+        `capacity` x `width` doubles in shared memory
+
+    `counters`:
+        0: head, total frames pushed (written by producer only)
+        1: tail, total frames drained (written by consumer only)
+        2: overflow, frames dropped because the ring was full
+    '''
+
+    def __init__(self, capacity, width):
+        self.capacity = capacity
+        self.width = width
+        self.slots = mp.RawArray('d', capacity * width)
+        self.counters = mp.RawArray('q', 3)
+        self.view = np.frombuffer(self.slots).reshape(capacity, width)
+
+    def __len__(self):
+        return self.counters[0] - self.counters[1]
+
+    @property
+    def overflow(self):
+        return self.counters[2]
+
+    def push(self, data, timestamp=None):
+        # `timestamp` overrides the last column of the stored frame
+        head = self.counters[0]
+        if head - self.counters[1] >= self.capacity:
+            self.counters[2] += 1
+            return False
+        slot = self.view[head % self.capacity]
+        slot[:] = data
+        if timestamp is not None:
+            slot[-1] = timestamp
+        self.counters[0] = head + 1 # publish after the slot is written
+        return True
+
+    def extend(self, data, timestamps=None):
+        # pushes (n, width) frames in one copy, frames that do not fit are
+        # dropped like in `push`; returns how many were stored
+        head = self.counters[0]
+        count = min(len(data), self.capacity - (head - self.counters[1]))
+        if count < len(data):
+            self.counters[2] += len(data) - count
+        if count <= 0:
+            return 0
+        slots = (head + np.arange(count)) % self.capacity
+        self.view[slots] = data[:count]
+        if timestamps is not None:
+            self.view[slots, -1] = timestamps[:count]
+        self.counters[0] = head + count
+        return count
+
+    def drain(self):
+        # copies out every frame pushed since the last drain as one
+        # contiguous (n, width) array, then releases the slots
+        head = self.counters[0]
+        tail = self.counters[1]
+        start = tail % self.capacity
+        end = start + head - tail
+        if end <= self.capacity:
+            data = self.view[start:end].copy()
+        else:
+            data = np.concatenate((self.view[start:], self.view[:end - self.capacity]))
+        self.counters[1] = head
+        return data
+
+
+class VisageRecording:
+    # append-only store of recorded frames in contiguous arrays
+
+    '''
+    `frames`:
+        timeline frame of each recorded row
+
+    `data`:
+        (n, width) frame data as float32, zero-copy views that are only
+        valid until the next append
+    '''
+
+    CAPACITY = 1024
+
+    def __init__(self, width):
+        self.width = width
+        self.clear()
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def frames(self):
+        return self._frames[:self.count]
+
+    @property
+    def data(self):
+        return self._data[:self.count]
+
+    def clear(self):
+        self.count = 0
+        self._frames = np.empty(self.CAPACITY)
+        self._data = np.empty((self.CAPACITY, self.width), dtype=np.float32)
+
+    def reserve(self, count):
+        # grows geometrically so appends are amortized O(1)
+        capacity = len(self._frames)
+        if count <= capacity:
+            return
+        while capacity < count:
+            capacity *= 2
+        frames = np.empty(capacity)
+        data = np.empty((capacity, self.width), dtype=np.float32)
+        frames[:self.count] = self.frames
+        data[:self.count] = self.data
+        self._frames = frames
+        self._data = data
+
+    def append(self, frame, data):
+        self.reserve(self.count + 1)
+        self._frames[self.count] = frame
+        self._data[self.count] = data
+        self.count += 1
+
+    def extend(self, frames, data):
+        end = self.count + len(frames)
+        self.reserve(end)
+        self._frames[self.count:end] = frames
+        self._data[self.count:end] = data
+        self.count = end
+
+    def pop(self, count):
+        # removes the first `count` rows and returns copies of them, keeping
+        # the capacity so a window recorded and popped in turn never grows
+        frames = self._frames[:count].copy()
+        data = self._data[:count].copy()
+        self._frames[:self.count - count] = self._frames[count:self.count]
+        self._data[:self.count - count] = self._data[count:self.count]
+        self.count -= count
+        return frames, data
+
+    def resolve(self):
+        return resolve_frames(self.frames, self.data)
+
+
+class VisageStreamFilter:
+    # per-channel online smoothing of frames, O(1) per frame
+
+    '''
+    `params`:
+        shared doubles: 0 is the mode (index in STREAM_FILTER_MODES), then
+        per channel minimum cutoff (hz) and beta, a channel with a cutoff of
+        0 is passed through
+
+    `ONE_EURO` adapts its cutoff to the speed of the channel, `CRITICAL`
+    follows the input with a critically damped spring of the cutoff frequency
+    '''
+
+    D_CUTOFF = 1.
+    MAX_GAP = 1. # seconds without frames before the filter restarts
+
+    def __init__(self, channels):
+        self.channels = channels
+        self.params = mp.RawArray('d', 1 + channels * 2)
+        self.view = np.frombuffer(self.params)
+        self.value = np.zeros(channels)
+        self.speed = np.zeros(channels)
+        self.frame = np.zeros(channels + 1)
+        self.time = None
+
+    @property
+    def mode(self):
+        return int(self.params[0])
+
+    def reset(self):
+        self.time = None
+
+    def apply(self, data):
+        # filters a frame (channels + timestamp), returns a reused array
+        frame = self.frame
+        frame[:] = data
+        x = frame[:-1]
+        t = frame[-1]
+
+        if self.time is None or not (0 < t - self.time < self.MAX_GAP):
+            self.value[:] = x
+            self.speed[:] = 0
+            self.time = t
+            return frame
+
+        dt = t - self.time
+        self.time = t
+        cutoff = self.view[1:1 + self.channels]
+        beta = self.view[1 + self.channels:]
+
+        if self.mode == 1:
+            speed = (x - self.value) / dt
+            self.speed += smoothing_alpha(dt, self.D_CUTOFF) * (speed - self.speed)
+            alpha = smoothing_alpha(dt, cutoff + beta * np.abs(self.speed))
+            value = self.value + alpha * (x - self.value)
+        else:
+            omega = 2 * math.pi * cutoff
+            delta = self.value - x
+            c = self.speed + omega * delta
+            decay = np.exp(-omega * dt)
+            value = x + (delta + c * dt) * decay
+            self.speed = (self.speed - omega * c * dt) * decay
+
+        self.value[:] = np.where(cutoff > 0, value, x)
+        x[:] = self.value
+        return frame
+
+
+class VisageStats:
+    # counters and fixed-bucket histograms in shared memory, written by the
+    # receiver and the main thread without locks, each slot has one writer
+
+    '''
+    `counters`:
+        one per `COUNTERS`, then the enabled flag
+
+    `buckets`:
+        counts for each of `HISTOGRAMS`, a value lands in the first bucket
+        whose upper edge is above it, the last bucket has no upper edge
+
+    `totals`:
+        sum and max for each of `HISTOGRAMS`
+    '''
+
+    COUNTERS = [
+        'packets', # datagrams received
+        'frames', # frames decoded, several per bundle
+        'unknown', # datagrams that were not /visage frames
+        'preview_ticks', # preview updates
+        'preview_idle', # preview updates without a new frame
+        'preview_skipped', # frames overwritten before a preview update
+    ]
+
+    TIME_EDGES = [10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 20000, 50000, 100000] # microseconds
+    DEPTH_EDGES = [1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024] # frames
+
+    HISTOGRAMS = [
+        ('transit', TIME_EDGES), # arrival minus phone time, above the lowest seen
+        ('decode', TIME_EDGES), # datagram to frame stored
+        ('queue_depth', DEPTH_EDGES), # recorded frames waiting per drain
+        ('apply', TIME_EDGES), # preview of every actor
+        ('bake', TIME_EDGES), # incremental keying per tick
+    ]
+
+    def __init__(self):
+        self.counters = mp.RawArray('q', len(self.COUNTERS) + 1)
+        self.index = {name: i for i, name in enumerate(self.COUNTERS)}
+        self.edges = {}
+        self.offsets = {}
+        offset = 0
+        for i, (name, edges) in enumerate(self.HISTOGRAMS):
+            self.edges[name] = edges
+            self.offsets[name] = (i, offset)
+            offset += len(edges) + 1
+        self.buckets = mp.RawArray('q', offset)
+        self.totals = mp.RawArray('d', 2 * len(self.HISTOGRAMS))
+
+    @property
+    def enabled(self):
+        return self.counters[-1] == 1
+
+    @enabled.setter
+    def enabled(self, value):
+        self.counters[-1] = 1 if value else 0
+
+    def reset(self):
+        enabled = self.enabled
+        self.counters[:] = [0] * len(self.counters)
+        self.buckets[:] = [0] * len(self.buckets)
+        self.totals[:] = [0] * len(self.totals)
+        self.enabled = enabled
+
+    def count(self, name, n=1):
+        self.counters[self.index[name]] += n
+
+    def add(self, name, value):
+        i, offset = self.offsets[name]
+        self.buckets[offset + bisect.bisect_right(self.edges[name], value)] += 1
+        self.totals[2 * i] += value
+        if value > self.totals[2 * i + 1]:
+            self.totals[2 * i + 1] = value
+
+    def histogram(self, name):
+        i, offset = self.offsets[name]
+        edges = self.edges[name]
+        counts = np.array(self.buckets[offset:offset + len(edges) + 1])
+        total = int(counts.sum())
+        result = {
+            'edges': edges,
+            'counts': counts.tolist(),
+            'count': total,
+            'mean': self.totals[2 * i] / total if total else 0.,
+            'max': self.totals[2 * i + 1],
+        }
+        # upper edge of the bucket holding each percentile
+        bounds = edges + [self.totals[2 * i + 1]]
+        cumulative = np.cumsum(counts)
+        for q in (50, 95, 99):
+            k = int(np.searchsorted(cumulative, total * q / 100.)) if total else 0
+            result['p%d' % q] = float(bounds[min(k, len(bounds) - 1)]) if total else 0.
+        return result
+
+    def snapshot(self):
+        return {
+            'counters': {name: self.counters[i] for name, i in self.index.items()},
+            'histograms': {name: self.histogram(name) for name, edges in self.HISTOGRAMS},
+        }
+
+    def dump(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.snapshot(), f, indent=2)
+
+
+class VisageTakeWriter:
+    # streams raw frames to a take file from the receiver thread/fork
+
+    BATCH = 64
+    SYNC_INTERVAL = 1. # seconds between fsyncs
+
+    def __init__(self, path, fps, quantize=False):
+        self.path = path
+        self.fps = fps
+        self.encoding = TAKE_ENCODING_QUANTIZED if quantize else TAKE_ENCODING_RAW
+        self.file = None
+        self.start = None
+        self.pending = np.empty((self.BATCH, 63))
+        self.count = 0
+        self.synced = 0
+
+    def open(self):
+        # on the main thread before the receiver starts, so a directory that
+        # cannot be written is reported rather than killing the capture
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        self.file = open(self.path, 'wb')
+        self.start = None
+        self.count = 0
+        self.synced = time.monotonic()
+
+    def fail(self, error):
+        # a full or vanished disk ends the take, not the capture
+        print('Visage stopped writing take to %s: %s' % (self.path, error))
+        try:
+            self.file.close()
+        except OSError:
+            pass
+        self.file = None
+
+    def write(self, data):
+        if self.file is None:
+            return
+        try:
+            if self.start is None:
+                # header goes out with the first frame, it holds its timestamp
+                self.start = data[-1]
+                self.file.write(TAKE_HEADER.pack(
+                    TAKE_MAGIC, TAKE_VERSION, self.encoding, 52, 10,
+                    self.fps, self.start, time.time()))
+            self.pending[self.count] = data
+            self.count += 1
+            if self.count == self.BATCH:
+                self.flush()
+            if time.monotonic() - self.synced > self.SYNC_INTERVAL:
+                self.sync()
+        except OSError as e:
+            self.fail(e)
+
+    def write_frames(self, data):
+        # (n, 63) frames at once, as from a bundle
+        if self.start is None:
+            self.write(data[0])
+            data = data[1:]
+        if self.file is None:
+            return
+        try:
+            self.flush()
+            self.file.write(encode_take_records(data, self.encoding, self.start).tobytes())
+            if time.monotonic() - self.synced > self.SYNC_INTERVAL:
+                self.sync()
+        except OSError as e:
+            self.fail(e)
+
+    def flush(self):
+        if self.count:
+            records = encode_take_records(self.pending[:self.count], self.encoding, self.start)
+            self.file.write(records.tobytes())
+            self.count = 0
+
+    def sync(self):
+        if self.file is None:
+            return
+        try:
+            self.flush()
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.synced = time.monotonic()
+        except OSError as e:
+            self.fail(e)
+
+    def close(self):
+        if self.file is not None:
+            self.sync()
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+class VisageChannel:
+    # one actor: frames arriving on `port`, from `source` if set, are
+    # written to `input` (and `take`)
+
+    def __init__(self, name, port, input, source='', take=None):
+        self.name = name
+        self.port = port
+        self.source = source
+        self.input = input
+        self.take = take
+
+    def attach(self):
+        self.state = self.input.status
+        self.timing = self.input.timing
+        self.data = self.input.frame
+        self.frames = self.input.buffer
+        self.event = self.input.event
+        self.filter = self.input.filter
+        self.filter.reset()
+        self.marked = False
+        self.offset_timeline = 0
+        self.offset_timestamp = 0
+        self.transit = float('inf') # lowest arrival minus phone time seen
+
+    def receive(self, *args):
+        if len(args) != 64:
+            raise ValueError('/visage needs 63 values, got %d' % (len(args) - 1))
+        self.receive_frame(args[1:])
+
+    def receive_frame(self, data):
+        is_recording = self.state[1] == 1
+
+        if self.take:
+            self.take.write(data)
+
+        if is_recording and not self.marked:
+            self.marked = True
+            self.offset_timeline = self.timing[0]
+            self.offset_timestamp = self.timing[1] = data[-1]
+        if not is_recording and self.marked:
+            self.marked = False
+
+        if self.filter.mode:
+            data = self.filter.apply(data)
+
+        if is_recording:
+            self.frames.push(data, data[-1] - self.offset_timestamp)
+
+        self.data[:] = data
+        self.state[2] += 1
+        self.event.set()
+
+    def receive_frames(self, data):
+        # (n, 63) frames in order, as from a bundle; they reach the buffer in
+        # one copy unless the stream filter has to step through them
+        if self.filter.mode:
+            for values in data:
+                self.receive_frame(values)
+            return
+
+        is_recording = self.state[1] == 1
+
+        if self.take:
+            self.take.write_frames(data)
+
+        if is_recording and not self.marked:
+            self.marked = True
+            self.offset_timeline = self.timing[0]
+            self.offset_timestamp = self.timing[1] = data[0, -1]
+        if not is_recording and self.marked:
+            self.marked = False
+
+        if is_recording:
+            self.frames.extend(data, data[:, -1] - self.offset_timestamp)
+
+        self.data[:] = data[-1]
+        self.state[2] += len(data)
+        self.event.set()
+
+
+class VisageReceiver:
+    # local singleton only, serves every channel from one selector loop
+
+    def __init__(self, host, channels, fork=False, stats=None):
+        self.host = host
+        self.channels = channels
+        self.fork = fork
+        self.stats = stats or VisageStats()
+        self.process = None
+        self.wake_r = None
+        self.wake_w = None
+        self.wait_time = 0
+        self.wait_time_avg = 0
+
+    @property
+    def is_running(self):
+        return self.channels[0].input.status[0] == 1
+
+    @property
+    def is_recording(self):
+        return self.channels[0].input.status[1] == 1
+
+    def set_status(self, index, value):
+        for channel in self.channels:
+            channel.input.status[index] = value
+
+    def start(self):
+        if self.process and self.process.is_alive():
+            return
+        else:
+            self.set_status(0, 1)
+            if self.fork:
+                method = mp.Process
+            else:
+                method = threading.Thread
+            self.wake_r, self.wake_w = socket.socketpair()
+            self.process = method(target=self.loop)
+            self.process.start()
+            if self.fork:
+                # the child owns its own copies of these
+                self.wake_r.close()
+                for channel in self.channels:
+                    if channel.take and channel.take.file:
+                        channel.take.file.close()
+                        channel.take.file = None
+
+    def stop(self):
+        self.set_status(0, 2)
+        if self.wake_w is not None:
+            # wakes the receive loop out of select() right away, unless it
+            # has already died and closed its end
+            try:
+                self.wake_w.send(b'\0')
+            except OSError:
+                pass
+            self.wake_w.close()
+            self.wake_w = None
+
+    def start_recording(self, timeline_seconds):
+        for channel in self.channels:
+            channel.input.status[1] = 1
+            channel.input.timing[0] = timeline_seconds
+
+    def stop_recording(self):
+        self.set_status(1, 0)
+
+    def wait_for_frame(self, timeout=1.):
+        # channels sharing an event wake on a frame from any of them
+        event = self.channels[0].input.event
+        start = time.perf_counter()
+        available = event.wait(timeout)
+        if available:
+            event.clear()
+        # time spent blocked on the network, smoothed for display
+        self.wait_time = time.perf_counter() - start
+        self.wait_time_avg = lerp(self.wait_time_avg, self.wait_time, 0.1)
+        return available
+
+    def loop(self):
+        from pythonosc import dispatcher # only needed for unknown messages
+
+        print('Visage OSC receiver started')
+
+        state = self.channels[0].input.status
+
+        # one socket per port, frames are routed to a channel by sender
+        # address, falling back to the channel without a source
+        selector = selectors.DefaultSelector()
+        takes = []
+        try:
+            selector.register(self.wake_r, selectors.EVENT_READ)
+            routes = {}
+            for channel in self.channels:
+                channel.attach()
+                channel.dispatch = dispatcher.Dispatcher()
+                channel.dispatch.map('/visage', channel.receive)
+                if channel.port not in routes:
+                    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+                    routes[channel.port] = {}
+                    selector.register(sock, selectors.EVENT_READ, routes[channel.port])
+                    sock.bind((self.host, channel.port))
+                    sock.setblocking(False)
+                routes[channel.port][channel.source] = channel
+
+            # takes were opened by the caller, see `VisageTakeWriter.open`
+            takes = [c.take for c in self.channels if c.take and c.take.file]
+            timeout = None
+            for take in takes:
+                timeout = take.SYNC_INTERVAL
+                print('Visage writing take to %s' % take.path)
+
+            while not state[0] == 2:
+                ready = selector.select(timeout)
+                if not ready:
+                    for take in takes:
+                        take.sync() # idle, make sure the tail is on disk
+                for key, events in ready:
+                    if key.data is None:
+                        key.fileobj.recv(64)
+                        continue
+                    sock = key.fileobj
+                    route = key.data
+                    default = route.get('')
+                    while True:
+                        try:
+                            packet, address = sock.recvfrom(65535)
+                        except (BlockingIOError, InterruptedError):
+                            break
+                        channel = route.get(address[0], default)
+                        if channel is None:
+                            continue
+                        try:
+                            self.receive_packet(channel, packet, address)
+                        except Exception as e:
+                            # one malformed message must not end the capture
+                            print('Visage dropped a packet from %s: %r' % (address[0], e))
+
+        finally:
+            print('Visage OSC receiver stopped')
+
+            for take in takes:
+                take.close()
+            for key in list(selector.get_map().values()):
+                if key.data is not None:
+                    key.fileobj.close()
+            selector.close()
+            self.wake_r.close()
+            self.set_status(0, 0) # a loop that died no longer reports running
+
+    def receive_packet(self, channel, packet, address):
+        stats = self.stats
+        arrival = time.perf_counter()
+        frames = None
+        values = decode_visage_packet(packet)
+        if values is not None:
+            channel.receive_frame(values)
+        else:
+            frames = decode_visage_frames(packet)
+            if frames is not None:
+                channel.receive_frames(frames)
+                values = frames[-1]
+            else:
+                channel.dispatch.call_handlers_for_packet(packet, address)
+        if stats.enabled:
+            stats.count('packets')
+            stats.add('decode', (time.perf_counter() - arrival) * 1e6)
+            if values is None:
+                stats.count('unknown')
+            else:
+                stats.count('frames', len(frames) if frames is not None else 1)
+                transit = arrival - values[-1]
+                channel.transit = min(channel.transit, transit)
+                stats.add('transit', (transit - channel.transit) * 1e6)
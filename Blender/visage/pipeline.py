@@ -0,0 +1,255 @@
+# offline cleanup of captured takes across every core, no blender needed:
+#
+#   python -m visage.pipeline takes/ --output cleaned/
+#   python -m visage.pipeline takes/ --output cleaned/ --stages decode neutral resample export --neutral pose.json
+
+import os
+import json
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from .core import (
+    RESAMPLE_MODES,
+    ROTATION_CHANNELS,
+    TAKE_ENCODING_QUANTIZED,
+    TAKE_ENCODING_RAW,
+    TAKE_EXTENSION,
+    decimate_keys,
+    decode_take_records,
+    filter_butterworth,
+    filter_savgol,
+    filter_window,
+    mp,
+    read_take,
+    resample_frames,
+    resolve_frames,
+    unwrap_rotations,
+    write_take,
+)
+
+
+FILTER_MODES = ['WINDOW', 'BUTTERWORTH', 'SAVGOL']
+EXPORT_FORMATS = ['npz', 'vtake']
+
+
+# each stage takes and returns a take as a dict:
+#
+#   `path`: source take file
+#   `info`: its header, see `core.read_take`
+#   `data`: (n, 63) frames, the last channel is seconds from the take start
+#   `keys`: indices into `data` kept per channel once decimated, else None
+#   `output`: file written by export, else None
+#
+# and `options`, a dict of the command line arguments
+
+
+def stage_decode(take, options):
+    info, records = read_take(take['path'])
+    if not len(records):
+        # a take cut short while its first frame was being written
+        raise ValueError('No frames in take: %s' % take['path'])
+    take['info'] = info
+    # records are in arrival order, reordered or repeated packets included,
+    # later stages need sorted and unique times
+    data = decode_take_records(records)
+    take['data'] = resolve_frames(data[:, 62], data)[1]
+    return take
+
+
+def stage_neutral(take, options):
+    # subtracts the neutral pose from the weights, head position and head
+    # rotation, the same shift the add-on applies; eyes are left as they are
+    if options['neutral'] is not None:
+        take['data'][:, :58] -= options['neutral'][:58]
+    return take
+
+
+def stage_resample(take, options):
+    # onto every `1 / subframes` frames at `fps`, the take's own by default
+    fps = options['fps'] or take['info']['fps']
+    data = take['data']
+    frames, data = resample_frames(data[:, 62] * fps, data, 1. / options['subframes'], options['resample'])
+    data[:, 62] = frames / fps
+    take['info']['fps'] = fps
+    take['data'] = data
+    return take
+
+
+def stage_filter(take, options):
+    # smooths each channel over time, rotations are unwrapped first so they
+    # do not jump across +-180 degrees
+    data = unwrap_rotations(take['data'])
+    values = data[:, :62].T
+    if len(data) > 1:
+        if options['filter'] == 'BUTTERWORTH':
+            spacing = np.median(np.diff(data[:, 62])) # seconds between frames
+            cutoff = min(options['cutoff'] * spacing, 0.5)
+            values = filter_butterworth(values, cutoff, options['order'])
+        elif options['filter'] == 'SAVGOL':
+            values = filter_savgol(values, options['samples'], options['order'])
+        else:
+            values = filter_window(values, options['samples'])
+    data[:, :62] = values.T
+    take['data'] = data
+    return take
+
+
+def stage_decimate(take, options):
+    # keys each channel needs to stay within `error` of every frame, in the
+    # units of the add-on's curves, so rotations are measured in radians
+    data = take['data']
+    x = data[:, 62] * take['info']['fps']
+    error = np.full(62, options['error'])
+    error[ROTATION_CHANNELS] = np.degrees(options['error'])
+    keys = []
+    for i in range(62):
+        y = data[:, i]
+        if len(y) < 3:
+            keys.append(np.arange(len(y)))
+            continue
+        keys.append(decimate_keys(x, y, np.gradient(y, x), error[i]))
+    take['keys'] = keys
+    return take
+
+
+def stage_export(take, options):
+    name = os.path.splitext(os.path.basename(take['path']))[0]
+    path = os.path.join(options['output'], name + '.' + options['format'])
+    if os.path.abspath(path) == os.path.abspath(take['path']):
+        raise ValueError('Export would overwrite its source: %s' % path)
+    os.makedirs(options['output'], exist_ok=True)
+
+    info = take['info']
+    data = take['data']
+    if options['format'] == 'vtake':
+        encoding = TAKE_ENCODING_QUANTIZED if options['quantize'] else TAKE_ENCODING_RAW
+        write_take(path, data, info['fps'], encoding, info['start'], info['created'])
+    else:
+        # decimated keys are stored ragged: each channel's indices one after
+        # the other, split by `key_counts`
+        keys = take['keys'] or [np.arange(len(data))] * 62
+        np.savez_compressed(path,
+            data=data.astype(np.float32),
+            fps=info['fps'],
+            start=info['start'],
+            key_indices=np.concatenate(keys).astype(np.int32),
+            key_counts=np.array([len(k) for k in keys], dtype=np.int32))
+    take['output'] = path
+    return take
+
+
+STAGES = {
+    'decode': stage_decode,
+    'neutral': stage_neutral,
+    'resample': stage_resample,
+    'filter': stage_filter,
+    'decimate': stage_decimate,
+    'export': stage_export,
+}
+
+
+def process_take(path, stages, options):
+    # runs in a worker process, returns a summary rather than the take so
+    # only a few numbers travel back to the parent
+    start = time.process_time()
+    take = {'path': path, 'info': None, 'data': None, 'keys': None, 'output': None}
+    for name in stages:
+        take = STAGES[name](take, options)
+    keys = take['keys']
+    return {
+        'path': path,
+        'output': take['output'],
+        'frames': len(take['data']),
+        'keys': int(sum(len(k) for k in keys)) if keys is not None else None,
+        'cpu': time.process_time() - start,
+    }
+
+
+def find_takes(paths):
+    # take files in `paths` and directly in any directories among them,
+    # largest first so long takes do not hold up the end of a batch
+    takes = []
+    for path in paths:
+        if os.path.isdir(path):
+            takes.extend(os.path.join(path, name) for name in sorted(os.listdir(path))
+                if name.endswith(TAKE_EXTENSION))
+        else:
+            takes.append(path)
+    return sorted(takes, key=os.path.getsize, reverse=True)
+
+
+def run_pipeline(paths, stages, options, workers=None):
+    # yields a summary per take as it completes, or its path and error;
+    # one bad take does not stop the rest
+    if not stages or stages[0] != 'decode':
+        raise ValueError('The first stage must be decode')
+    with ProcessPoolExecutor(workers, mp_context=mp) as executor:
+        futures = {executor.submit(process_take, path, stages, options): path for path in paths}
+        for future in as_completed(futures):
+            try:
+                yield future.result()
+            except Exception as e:
+                yield {'path': futures[future], 'error': '%s: %s' % (type(e).__name__, e)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m visage.pipeline',
+        description='Clean up Visage take files in parallel.')
+    parser.add_argument('paths', nargs='+', help='take files or directories of them')
+    parser.add_argument('--output', default='cleaned', help='directory to export to')
+    parser.add_argument('--stages', nargs='+', choices=list(STAGES), default=list(STAGES))
+    parser.add_argument('--workers', type=int, default=None, help='processes, one per core by default')
+    parser.add_argument('--neutral', help='json list of the 62 channel values of the neutral pose')
+    parser.add_argument('--fps', type=float, default=0, help='resample frame rate, 0 for the take\'s own')
+    parser.add_argument('--resample', choices=RESAMPLE_MODES, default='LINEAR')
+    parser.add_argument('--subframes', type=int, default=1)
+    parser.add_argument('--filter', choices=FILTER_MODES, default='BUTTERWORTH')
+    parser.add_argument('--samples', type=int, default=2, help='window and savgol half width in frames')
+    parser.add_argument('--cutoff', type=float, default=8., help='butterworth cutoff in hz')
+    parser.add_argument('--order', type=int, default=2, help='butterworth and savgol order')
+    parser.add_argument('--error', type=float, default=0.005, help='decimate tolerance')
+    parser.add_argument('--format', choices=EXPORT_FORMATS, default='npz')
+    parser.add_argument('--quantize', action='store_true', help='store blendshapes as 16 bit in vtake exports')
+    parser.add_argument('--json', help='also write the summaries to this file')
+    args = parser.parse_args(argv)
+
+    if args.stages[0] != 'decode':
+        parser.error('the first stage must be decode')
+    if args.format == 'vtake' and 'decimate' in args.stages and 'export' in args.stages:
+        parser.error('decimated keys can only be exported as npz')
+
+    options = vars(args).copy()
+    if args.neutral:
+        with open(args.neutral) as f:
+            options['neutral'] = np.array(json.load(f), dtype=np.float64)
+        if options['neutral'].shape != (62,):
+            parser.error('the neutral pose needs 62 values')
+
+    paths = find_takes(args.paths)
+    start = time.monotonic()
+    results = []
+    for result in run_pipeline(paths, args.stages, options, args.workers):
+        results.append(result)
+        if 'error' in result:
+            print('%s: %s' % (result['path'], result['error']))
+        elif result['keys'] is not None:
+            print('%s: %d frames, %d keys, %.2f s' % (result['path'], result['frames'], result['keys'], result['cpu']))
+        else:
+            print('%s: %d frames, %.2f s' % (result['path'], result['frames'], result['cpu']))
+
+    failed = sum('error' in r for r in results)
+    wall = time.monotonic() - start
+    cpu = sum(r.get('cpu', 0) for r in results)
+    print('%d takes, %d failed, %.1f s wall, %.1f s cpu' % (len(results), failed, wall, cpu))
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
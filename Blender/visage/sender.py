@@ -0,0 +1,131 @@
+# synthetic visage sender for testing without a phone, no blender needed:
+#
+#   python -m visage.sender --port 8080 --rate 60 --duration 10
+#   python -m visage.sender --port 8080 --bundle 4 --compact
+
+import time
+import socket
+import argparse
+
+import numpy as np
+
+from .core import encode_visage_bundle, encode_visage_compact, encode_visage_packet
+
+
+def synthetic_frames(count, rate=60., seed=0):
+    # slow, smooth motion on every channel, timestamps are filled in on send
+    rng = np.random.default_rng(seed)
+    t = np.arange(count)[:, None] / rate
+    freq = rng.uniform(0.1, 1.5, 63)
+    phase = rng.uniform(0, 2 * np.pi, 63)
+    wave = np.sin(2 * np.pi * freq * t + phase)
+    frames = np.empty((count, 63))
+    frames[:, :52] = 0.5 + 0.5 * wave[:, :52] # blendshape weights
+    frames[:, 52:55] = 0.05 * wave[:, 52:55] # head position
+    frames[:, 55:58] = 20. * wave[:, 55:58] # head rotation
+    frames[:, 58:62] = 15. * wave[:, 58:62] # eye rotation
+    frames[:, 62] = t[:, 0]
+    return frames
+
+
+def make_schedule(rate, duration, jitter=0., loss=0., loss_run=1, reorder=0., burst=1, seed=0):
+    '''
+    `jitter`:
+        standard deviation of send times in seconds, never reorders frames
+
+    `loss`:
+        fraction of frames dropped, in runs of `loss_run` consecutive frames
+
+    `reorder`:
+        chance of a frame being sent after the one following it
+
+    `burst`:
+        frames held back and sent together, like a phone catching up
+
+    Returns the frame indices in send order and their send times in
+    seconds from the start.
+    '''
+    rng = np.random.default_rng(seed)
+    count = int(rate * duration)
+    order = np.arange(count)
+
+    times = order / rate
+    if jitter:
+        times = np.sort(np.maximum(times + rng.normal(0, jitter, count), 0))
+    if burst > 1:
+        times = times[np.minimum((order // burst + 1) * burst - 1, count - 1)]
+
+    if reorder:
+        swap = np.flatnonzero(rng.random(count - 1) < reorder)
+        last = -2
+        for i in swap:
+            if i > last + 1: # pairs must not overlap
+                order[i], order[i + 1] = order[i + 1], order[i]
+                last = i
+
+    if loss:
+        starts = rng.random(count) < loss / loss_run
+        dropped = np.convolve(starts, np.ones(loss_run))[:count] > 0
+        order = order[~dropped]
+        times = times[~dropped]
+
+    return order, times
+
+
+def send_frames(host, port, frames, order, times, epoch=None, bundle=1, compact=False):
+    # the last channel is overwritten with the send time in seconds since
+    # `epoch` (time.monotonic), keep it recent to stay precise as float32;
+    # with `bundle` frames per datagram each frame is stamped with its
+    # scheduled time and goes out with the last one of its group, as an OSC
+    # bundle or as one `compact` message
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    start = time.monotonic()
+    if epoch is None:
+        epoch = start
+    frame = np.empty(63)
+    for i in range(0, len(order), bundle):
+        index = order[i:i + bundle]
+        delay = start + times[i + len(index) - 1] - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        if bundle == 1 and not compact:
+            frame[:] = frames[index[0]]
+            frame[-1] = time.monotonic() - epoch
+            packet = encode_visage_packet(frame)
+        else:
+            data = frames[index]
+            data[:, -1] = start + times[i:i + len(index)] - epoch
+            packet = encode_visage_compact(data) if compact else encode_visage_bundle(data)
+        sock.sendto(packet, (host, port))
+    sock.close()
+    return len(order)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m visage.sender',
+        description='Send synthetic Visage OSC frames.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--rate', type=float, default=60., help='frames per second')
+    parser.add_argument('--duration', type=float, default=10., help='seconds to send')
+    parser.add_argument('--jitter', type=float, default=0., help='send time deviation in milliseconds')
+    parser.add_argument('--loss', type=float, default=0., help='fraction of frames dropped')
+    parser.add_argument('--loss-run', type=int, default=1, help='consecutive frames per drop')
+    parser.add_argument('--reorder', type=float, default=0., help='chance of swapping a frame with the next')
+    parser.add_argument('--burst', type=int, default=1, help='frames sent together')
+    parser.add_argument('--bundle', type=int, default=1, help='frames per datagram, as an OSC bundle')
+    parser.add_argument('--compact', action='store_true', help='send /visage/q messages with 16 bit blendshapes')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    frames = synthetic_frames(int(args.rate * args.duration), args.rate, args.seed)
+    order, times = make_schedule(
+        args.rate, args.duration, args.jitter / 1000., args.loss, args.loss_run,
+        args.reorder, args.burst, args.seed)
+    sent = send_frames(args.host, args.port, frames, order, times, bundle=args.bundle, compact=args.compact)
+    print('%d frames sent to %s:%d' % (sent, args.host, args.port))
+
+
+if __name__ == '__main__':
+    main()